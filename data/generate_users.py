@@ -48,6 +48,7 @@ parser.add_argument('--output', help="File to which the data will be dumped (jso
 parser.add_argument('--products', help="Json file with list of possible producsts.", default="products.json")
 parser.add_argument('--purchase_probability', help="The probability of an item being purchased.", default=0.05)
 parser.add_argument('--adding_probability', help="The probability of an item being added.", default=0.75)
+parser.add_argument('--shards', type=int, help="Number of files (shards) in which the users are split by the hash of their id.", default=1)
 args = parser.parse_args()
 
 
@@ -58,6 +59,23 @@ def hashstring(s: str) ->str:
     """
     return hashlib.sha224(s.encode('ascii')).hexdigest()
 
+def shard_of(id: str, shards: int) -> int:
+    """
+    Returns the shard of an user from its id (a sha224 hex digest). This must
+    match the `shardOf` function used by the `DataManager`.
+    """
+    return int(id, 16) % shards
+
+def shard_file_name(path: str, shard: int, shards: int) -> str:
+    """
+    Returns the file name of a shard (`users.json` becomes `users.0-of-4.json`).
+    This must match the `shardFileName` function used by the `DataManager`.
+    """
+    if shards == 1:
+        return path
+    root, extension = os.path.splitext(path)
+    return root + "." + str(shard) + "-of-" + str(shards) + extension
+
 def isascii(s: str):
     """
     Check if the characters in string s are in ASCII, U+0-U+7F.
@@ -171,10 +189,14 @@ def creating_and_saving_user_data() -> Dict[str, Dict[str, Any]]:
         user_data: Dict[str, Any] = random_user_data(name, products)
         users[id] = user_data
 
-    # NOTE: saving users data to file.
-    with open(args.output, "w") as fid:
-        dump = json.dumps(users, indent=4)
-        fid.write(dump)
+    # NOTE: saving users data to file (one per shard).
+    shards: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(args.shards)]
+    for id, user_data in users.items():
+        shards[shard_of(id, args.shards)][id] = user_data
+    for shard, shard_users in enumerate(shards):
+        with open(shard_file_name(args.output, shard, args.shards), "w") as fid:
+            dump = json.dumps(shard_users, indent=4)
+            fid.write(dump)
 
     return users
 
@@ -25,4 +25,106 @@ print("   - User Id is:", user)
 print("10. Query list of purchased items by trixy culverhouse using the data manager.")
 print("  ", dm.query(purchased=True, user_id=user))
 print("11. Query list of purchased items by trixy culverhouse using the User API.")
-print("  ", user.query(purchased=True))
\ No newline at end of file
+print("  ", user.query(purchased=True))
+print("12. Estimate the number of each of the purchased items (approximate mode).")
+print("  ", dm.query(purchased=True, approximate=True))
+print("13. Top 3 users by spend on purchased items.")
+print("  ", dm.groupByUser(purchased=True, top=3, order_by="spend"))
+print("14. Estimate the memory used by the data manager (bytes).")
+print("  ", dm.memoryUsage())
+print("15. Stream a gzip export of all users and compare its peak memory with json.dumps(dm.dictionary()).")
+import os
+import json
+import time
+import tempfile
+import tracemalloc
+with tempfile.TemporaryDirectory() as directory:
+    tracemalloc.start()
+    start = time.perf_counter()
+    paths = dm.export(os.path.join(directory, "users.json"), compression="gzip", users_per_file=50)
+    elapsed = time.perf_counter() - start
+    _, export_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+tracemalloc.start()
+string = json.dumps(dm.dictionary(), indent=4)
+_, string_peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+del string
+print("   - Files written:", len(paths))
+print("   - Throughput:", int(len(dm.dictionary()) / elapsed), "users/s")
+print("   - Export peak memory below json.dumps peak memory:", export_peak < string_peak, "(", export_peak, "<", string_peak, ")")
+print("16. Export the purchased operations as columns and check them against the query.")
+with tempfile.TemporaryDirectory() as directory:
+    paths = dm.exportColumns(os.path.join(directory, "purchased.npz"), purchased=True)
+    columns = dm.columns(purchased=True)
+counts = {}
+for code in columns["product"]:
+    counts[columns["product_names"][code]] = counts.get(columns["product_names"][code], 0) + 1
+print("   - Operations:", len(columns["price"]), "total price:", sum(columns["price"]))
+print("   - Same counts as the query:", counts == dm.query(purchased=True))
+print("17. Keep the removed items above 300 as a view and ingest an operation.")
+dm.createView("removed_above_300", added=False, above=300)
+changes = []
+dm.subscribe("removed_above_300", lambda name, result: changes.append(result))
+dm.addOperation(user.id(), "quick-test-removed", "Rokit Monitor", 450, False, False)
+print("  ", dm.view("removed_above_300"))
+print("   - Notified:", len(changes), "same as the query:", dm.view("removed_above_300") == dm.query(added=False, above=300))
+print("18. Replay 100 random queries from 4 threads.")
+from src.Managers import WorkloadReplay, generateWorkload, runQuery
+report = WorkloadReplay(lambda record: runQuery(dm, record), concurrency=4).run(generateWorkload(dm, 100, seed=1))
+print("   - Requests:", report["requests"], "errors:", report["errors"], "query types:", len(report["types"]))
+print("19. Top 3 associations between products added to the same basket.")
+for association in dm.associations(added=True, top=3):
+    print("   -", association["antecedent"], "->", association["consequent"], "lift: %.3f" % association["lift"])
+print("20. Revenue, median price and price histogram of purchased items.")
+print("  ", dm.revenue(purchased=True))
+print("  ", dm.priceQuantiles((0.5,), purchased=True))
+histogram = dm.priceHistogram(3, purchased=True)
+for bin in histogram:
+    print("   -", bin)
+histogram = dm.priceHistogram(4, purchased=True, product_name="Pioneer DJ Mixer", below=699)
+print("   - Histogram counts add up to the revenue count:", sum(bin["count"] for bin in histogram) == dm.revenue(purchased=True, product_name="Pioneer DJ Mixer", below=699)["count"])
+print("21. Split the users into 2 shard files and compare the queries of a sharded data manager.")
+from src.Managers.DataShard import shardOf, shardFileName
+from src.Utils import SingletonMetaClass
+with tempfile.TemporaryDirectory() as directory:
+    dictionary = dm.dictionary()
+    for shard in range(2):
+        with open(shardFileName(os.path.join(directory, "users.json"), shard, 2), "w") as fid:
+            json.dump({key: value for key, value in dictionary.items() if shardOf(key, 2) == shard}, fid)
+    # NOTE: the data manager is a singleton, the sharded one is built aside.
+    SingletonMetaClass._instances.pop(DataManager)
+    sharded = DataManager(os.path.join(directory, "users.json"), os.path.join(directory, "safe_users.json"), shards=2)
+    SingletonMetaClass._instances[DataManager] = dm
+filters = [{"purchased": True}, {"added": True, "above": 300, "below": 600}, {"added": False, "product_name": "Rokit Monitor"}, {"purchased": True, "user_id": user.id()}]
+print("   - Same users:", sorted(sharded.userIds()) == sorted(dm.userIds()))
+print("   - Same results as the single file:", all(sharded.query(**kwargs) == dm.query(**kwargs) and sharded.groupByUser(**kwargs) == dm.groupByUser(**kwargs) for kwargs in filters))
+print("22. Query from 4 threads while ingesting 200 operations and reloading the data.")
+import threading
+errors = []
+done = threading.Event()
+def read():
+    while not done.is_set():
+        try:
+            dm.query(added=True, above=300)
+            dm.view("removed_above_300")
+        except Exception as error:
+            errors.append(error)
+readers = [threading.Thread(target=read) for _ in range(4)]
+for reader in readers:
+    reader.start()
+reload = threading.Thread(target=dm._load)
+for number in range(200):
+    dm.addOperation(user.id(), "quick-test-concurrent-" + str(number), "Rokit Monitor", 100 + number, True, False)
+    if number == 100:
+        reload.start()
+reload.join()
+done.set()
+for reader in readers:
+    reader.join()
+counts = {}
+for user_id in dm.userIds():
+    for name, count in dm.userById(user_id).query(added=True).items():
+        counts[name] = counts.get(name, 0) + count
+print("   - Errors:", len(errors), "same as the user histories:", counts == dm.query(added=True))
+print("   - View same as the query:", dm.view("removed_above_300") == dm.query(added=False, above=300))
@@ -0,0 +1,77 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# ##########################################################################
+# Replays a workload of shobo.py queries and reports latency and throughput:
+#   python replay.py --generate 1000 (writes 1000 random queries into data/workload.jsonl)
+#   python replay.py (runs data/workload.jsonl once, one query at a time)
+#   python replay.py --concurrency 8 --rate 200 --repeat 5 (8 threads at 200 queries/s)
+#   python replay.py --url "http://localhost:8080/query" (posts each query to a server)
+#   python shobo.py --removed --above 300 --record data/workload.jsonl (records a live query)
+# ##########################################################################
+
+# Generic libraries
+import json
+import argparse
+
+# Loading shobo libraries
+from src.Managers import DataManager, WorkloadReplay, readWorkload, generateWorkload, runQuery, httpTarget
+
+
+parser = argparse.ArgumentParser(description="Replay a workload of queries (JSONL with the flags of shobo.py) and report latency and throughput.")
+parser.add_argument('--workload', type=str, help="JSONL file with one query per line (e.g. {\"removed\": true, \"above\": 300}).", default="data/workload.jsonl")
+parser.add_argument('--generate', type=int, help="Write this number of random queries into the workload file instead of replaying it.", default=None)
+parser.add_argument('--seed', type=int, help="Seed for the random queries of --generate.", default=None)
+parser.add_argument('--concurrency', type=int, help="Number of threads sending queries.", default=1)
+parser.add_argument('--rate', type=float, help="Queries per second (as fast as possible if not given).", default=None)
+parser.add_argument('--repeat', type=int, help="Number of times the workload is replayed.", default=1)
+parser.add_argument('--url', type=str, help="Post the queries (as json) to this server endpoint instead of the in process DataManager.", default=None)
+parser.add_argument('--shards', type=int, help="Number of files (shards) in which the user data is split (data/users.0-of-N.json, ...).", default=1)
+parser.add_argument('--json', help="Print the report as json.", action='store_true')
+args = parser.parse_args()
+
+
+if args.generate is not None:
+    dm = DataManager("data/users.json", "data/safe_users.json", shards=args.shards)
+    with open(args.workload, "w") as fid:
+        for record in generateWorkload(dm, args.generate, seed=args.seed):
+            fid.write(json.dumps(record) + "\n")
+    print("Queries written:", args.generate, "into", args.workload)
+    raise SystemExit()
+
+records = readWorkload(args.workload) * args.repeat
+if args.url:
+    target = httpTarget(args.url)
+else:
+    dm = DataManager("data/users.json", "data/safe_users.json", shards=args.shards)
+    target = lambda record: runQuery(dm, record)
+report = WorkloadReplay(target, concurrency=args.concurrency, rate=args.rate).run(records)
+
+if args.json:
+    print(json.dumps(report, indent=4))
+    raise SystemExit()
+print("Requests:", report["requests"], "Errors:", report["errors"], "Duration: %.3f s" % report["duration"], "Throughput: %.1f queries/s" % report["throughput"])
+print("%-40s %8s %8s %10s %10s %10s %10s" % ("Query type", "requests", "errors", "p50 (ms)", "p95 (ms)", "p99 (ms)", "max (ms)"))
+for name, statistics in list(report["types"].items()) + [("all", report)]:
+    print("%-40s %8d %8d %10.3f %10.3f %10.3f %10.3f" % (name, statistics["requests"], statistics["errors"], statistics["p50"], statistics["p95"], statistics["p99"], statistics["max"]))
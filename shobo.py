@@ -34,14 +34,18 @@ SOFTWARE.
 #   python shobo.py --added (all products added)
 #   python shobo.py --purchased (all products purchased)
 #   python shobo.py --purchased --above 300 --below 600 (all producst purchased with price above 300 and below 600)
+#   python shobo.py --removed --above 300 --explain (same query, also showing the plan used to answer it)
+#   python shobo.py --purchased --revenue --histogram 5 (all products purchased with their revenue and price histogram)
+#   python shobo.py --removed --above 300 --record data/workload.jsonl (same query, also appended to a workload for replay.py)
 # ##########################################################################
 
 # Generic libraries
 import sys
+import json
 import argparse
 
 # Loading shobo libraries
-from src.Managers import DataManager
+from src.Managers import DataManager, recordQuery
 
 
 # NOTE: creating a command line arguments parse.
@@ -55,10 +59,43 @@ parser.add_argument('--added', help="Limit the query to added products.", action
 parser.add_argument('--removed', help="Limit the query to removed products (opposite).", action='store_true')
 parser.add_argument('--above', type=int, help="Limit the query to products with price above the input.", default=None)
 parser.add_argument('--below', type=int, help="Limit the query to products with price below the input.", default=None)
+parser.add_argument('--shards', type=int, help="Number of files (shards) in which the user data is split (data/users.0-of-N.json, ...).", default=1)
+parser.add_argument('--explain', help="Show the plan chosen to answer the query (estimated and actual operations scanned).", action='store_true')
+parser.add_argument('--revenue', help="Also show the number of operations, revenue (sum of prices) and mean price of the query.", action='store_true')
+parser.add_argument('--histogram', type=int, help="Also show the histogram of the prices of the query with this number of bins.", default=None)
+parser.add_argument('--record', type=str, help="Append the query to this JSONL workload file (to replay it with replay.py).", default=None)
 args = parser.parse_args()
 
+
+def print_query_result(result):
+    """
+    Prints the query result (and the query plan when `--explain` is used).
+    """
+    if args.explain:
+        plan = dict(result)
+        result = plan.pop("result")
+        print("Query Plan:", json.dumps(plan, indent=4))
+    print("Query Result:", result)
+
+
+def print_price_analytics(**filters):
+    """
+    Prints the revenue (with `--revenue`) and the price histogram (with `--histogram`)
+    of the operations matching the query filters.
+    """
+    if args.revenue:
+        print("Revenue:", dm.revenue(**filters))
+    if args.histogram:
+        print("Price Histogram (Low, High, Count, Revenue):")
+        for bin in dm.priceHistogram(args.histogram, **filters):
+            print("   %10.2f %10.2f %8d %12.2f" % (bin["low"], bin["high"], bin["count"], bin["revenue"]))
+
+
+if args.record:
+    recordQuery(args.record, vars(args))
+
 # NOTE: creating data manager.
-dm = DataManager("data/users.json", "data/safe_users.json")
+dm = DataManager("data/users.json", "data/safe_users.json", shards=args.shards)
 
 if args.removed:
     args.added = not args.removed
@@ -72,13 +109,15 @@ if args.user_id and not any([args.purchased, args.added, args.removed, args.abov
 elif args.user_id and any([args.purchased, args.added, args.removed, args.above, args.below]):
     user = dm.userById(args.user_id)
     print("User Name:", user.name())
-    print("Query Result:", dm.query(user_id=args.user_id, 
-                                    product_name=args.product_name if args.product_name else None,
-                                    purchased=args.purchased if args.purchased else False,
-                                    added=args.added if args.added else False,
-                                    above=args.above if args.above else None,
-                                    below=args.below if args.below else None,
-                                    ))
+    filters = dict(user_id=args.user_id, 
+                   product_name=args.product_name if args.product_name else None,
+                   purchased=args.purchased if args.purchased else False,
+                   added=args.added if args.added else False,
+                   above=args.above if args.above else None,
+                   below=args.below if args.below else None,
+                   )
+    print_query_result(dm.query(explain=args.explain, **filters))
+    print_price_analytics(**filters)
     sys.exit()
 
 if args.user_name and not any([args.purchased, args.added, args.removed, args.above, args.below]):
@@ -93,18 +132,22 @@ elif args.user_name and any([args.purchased, args.added, args.removed, args.abov
     if len(users) == 0:
         print("No such user exists.")
         sys.exit()
-    print("Query Result:", dm.query(user_id=users[0].id(), 
-                                    product_name=args.product_name if args.product_name else None,
-                                    purchased=args.purchased if args.purchased else False,
-                                    added=args.added if args.added else False,
-                                    above=args.above if args.above else None,
-                                    below=args.below if args.below else None,
-                                    ))
+    filters = dict(user_id=users[0].id(), 
+                   product_name=args.product_name if args.product_name else None,
+                   purchased=args.purchased if args.purchased else False,
+                   added=args.added if args.added else False,
+                   above=args.above if args.above else None,
+                   below=args.below if args.below else None,
+                   )
+    print_query_result(dm.query(explain=args.explain, **filters))
+    print_price_analytics(**filters)
     sys.exit()
 
-print("Query Result:", dm.query(product_name=args.product_name if args.product_name else None,
-                                purchased=args.purchased if args.purchased else False,
-                                added=args.added if args.added else False,
-                                above=args.above if args.above else None,
-                                below=args.below if args.below else None,
-                                ))
+filters = dict(product_name=args.product_name if args.product_name else None,
+               purchased=args.purchased if args.purchased else False,
+               added=args.added if args.added else False,
+               above=args.above if args.above else None,
+               below=args.below if args.below else None,
+               )
+print_query_result(dm.query(explain=args.explain, **filters))
+print_price_analytics(**filters)
@@ -0,0 +1,515 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+# Generic libraries
+from typing import Dict, Tuple, List, Iterable, Iterator, Any
+from array import array
+import threading
+import bisect
+import math
+import base64
+import zlib
+
+# Local libraries
+from .CommonVariables import *
+from .HistoryContainer import Operation
+
+
+def bits(bitmap: int) -> Iterator[int]:
+    """
+    Yields the position of each bit set in the bitmap (lowest first).
+
+    Note
+    ----
+
+    Isolating the lowest bit of a python integer copies the whole integer, so
+    the bitmap is converted to bytes once and the bytes are scanned instead.
+    """
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for index, byte in enumerate(data):
+        while byte:
+            lowest = byte & -byte
+            yield (index << 3) + lowest.bit_length() - 1
+            byte ^= lowest
+
+
+class ColumnExports:
+    """
+    Keeps track of the views exported (see `BitmapIndex.columns`) of the per
+    operation columns shared by several copies of a `BitmapIndex`.
+    """
+    Lock: threading.Lock = None
+    Exported: bool = None
+    def __init__(self) -> None:
+        self.Lock = threading.Lock()
+        self.Exported = False
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"Exported": self.Exported}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.Lock = threading.Lock()
+        self.Exported = state["Exported"]
+
+
+class BitmapIndex:
+    """
+    The `BitmapIndex` stores one bitmap per low cardinality attribute of the
+    operations (`added` flag, `purchased` flag, product name and price bucket).
+    Every operation gets a global number (the order in which it was added to the
+    index) and that number is the bit it occupies in each bitmap.
+
+    A query is then answered by AND/OR-ing the bitmaps and counting the bits
+    that remain set for each product.
+
+    Note
+    ----
+
+    The bitmaps are python integers (arbitrary precision) so the bitwise operations
+    and the population count are done natively. When written to file each bitmap
+    is compressed with zlib (sparse bitmaps are mostly zeros and compress well).
+
+    Along with the bitmaps the index keeps, per operation number, the price, the
+    product code, the flags and the user (index in the shard). With those the
+    query planner has two more access paths: scanning a single product
+    (`queryProduct`) or a price band through the operations sorted by price
+    (`queryPrice`). They are also exported as columns (see `columns`).
+    """
+    _bucket_width: int = None
+    _size: int = None
+    _prices: array = None
+    _codes: array = None
+    _flags: array = None
+    _users: array = None
+    _exports: ColumnExports = None
+    _names: List[str] = None
+    _price_order: List[int] = None
+    _sorted_prices: List[float] = None
+    _pending_order: List[int] = None
+    _pending_prices: List[float] = None
+    _statistics: Dict[str, Any] = None
+    _added: Dict[bool, int] = None
+    _purchased: Dict[bool, int] = None
+    _products: Dict[str, int] = None
+    _buckets: Dict[int, int] = None
+    def __init__(self, dictionary: Dict[str, Any] = None, bucket_width: int = 100) -> None:
+        self._bucket_width = bucket_width
+        self._size = 0
+        self._prices = array("d")
+        self._codes = array("i")
+        self._flags = array("B")
+        self._users = array("i")
+        self._exports = ColumnExports()
+        self._names = []
+        self._added = {True: 0, False: 0}
+        self._purchased = {True: 0, False: 0}
+        self._products = {}
+        self._buckets = {}
+        if dictionary:
+            self._buildIndexFromDictionary(dictionary)
+
+    def size(self) -> int:
+        """
+        Returns the number of operations in the index.
+        """
+        return self._size
+
+    def copy(self) -> "BitmapIndex":
+        """
+        Returns a copy of this index that can be extended without modifying
+        this one.
+
+        Note
+        ----
+
+        The bitmaps are immutable integers so only the dictionaries are copied.
+        The operations sorted by price are shared too (only the pending ones are
+        copied, see `_priceBand`).
+        The per operation columns (prices, codes, flags and users) are shared: they
+        are only ever appended to and each index only reads its own operations.
+        Once a view of them was exported (see `columns`) the next `extend` gives
+        the extended index its own copy instead of resizing them.
+        """
+        bitmap_index = BitmapIndex(bucket_width=self._bucket_width)
+        bitmap_index._size = self._size
+        bitmap_index._prices = self._prices
+        bitmap_index._codes = self._codes
+        bitmap_index._flags = self._flags
+        bitmap_index._users = self._users
+        bitmap_index._exports = self._exports
+        bitmap_index._names = list(self._names)
+        bitmap_index._added = dict(self._added)
+        bitmap_index._purchased = dict(self._purchased)
+        bitmap_index._products = dict(self._products)
+        bitmap_index._buckets = dict(self._buckets)
+        bitmap_index._price_order = self._price_order
+        bitmap_index._sorted_prices = self._sorted_prices
+        if self._price_order is not None:
+            bitmap_index._pending_order = list(self._pending_order)
+            bitmap_index._pending_prices = list(self._pending_prices)
+        return bitmap_index
+
+    def add(self, operation: Operation, user: int) -> int:
+        """
+        Adds an operation (of the user with the given index) to the index and
+        returns its global number.
+        """
+        self.extend([operation], [user])
+        return self._size - 1
+
+    def extend(self, operations: Iterable[Operation], users: Iterable[int]) -> None:
+        """
+        Adds several operations to the index in one go, along with the index
+        of the user of each operation.
+
+        Note
+        ----
+
+        Setting bits one by one on a python integer creates a new integer each
+        time (quadratic for a full load). Instead the bits of each bitmap are
+        first set in a `bytearray` and only then merged into the integer.
+        """
+        start = self._size
+        operations = list(operations)
+        with self._exports.Lock:
+            self._truncateColumns(start)
+            self._users.extend(users)
+            self._statistics = None
+            length = (len(operations) + 7) // 8
+            added: Dict[bool, bytearray] = {}
+            purchased: Dict[bool, bytearray] = {}
+            products: Dict[str, bytearray] = {}
+            buckets: Dict[int, bytearray] = {}
+            codes = {name: code for code, name in enumerate(self._names)}
+            for number, operation in enumerate(operations):
+                self._prices.append(operation.Price)
+                if operation.Name not in codes:
+                    codes[operation.Name] = len(self._names)
+                    self._names.append(operation.Name)
+                self._codes.append(codes[operation.Name])
+                self._flags.append((1 if operation.Added else 0) | (2 if operation.Purchased else 0))
+                for bitmaps, key in ((added, operation.Added), (purchased, operation.Purchased),
+                                     (products, operation.Name), (buckets, self._bucket(operation.Price))):
+                    if key not in bitmaps:
+                        bitmaps[key] = bytearray(length)
+                    bitmaps[key][number >> 3] |= 1 << (number & 7)
+            for target, bitmaps in ((self._added, added), (self._purchased, purchased),
+                                    (self._products, products), (self._buckets, buckets)):
+                for key, array in bitmaps.items():
+                    target[key] = target.get(key, 0) | (int.from_bytes(array, "little") << start)
+            self._size += len(operations)
+        if self._price_order is not None:
+            for number in range(start, self._size):
+                position = bisect.bisect_right(self._pending_prices, self._prices[number])
+                self._pending_prices.insert(position, self._prices[number])
+                self._pending_order.insert(position, number)
+            if len(self._pending_order) > max(32, math.isqrt(len(self._price_order))):
+                self._sortPrices()
+
+    def query(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> Dict[str, int]:
+        """
+        Returns a dictionary with the query made for the `purchase` and
+        `added` flags (same result as the `HistoryContainer.query` over all
+        operations).
+        """
+        return self.queryBitmaps(purchased=purchased, added=added, above=above, below=below, product_name=product_name)[0]
+
+    def queryBitmaps(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> Tuple[Dict[str, int], int]:
+        """
+        Same as `query` but also returns the number of operations scanned (the
+        ones in the price buckets crossing a bound of the price band).
+        """
+        bitmap, scanned = self._selection(purchased, added, above, below, product_name)
+        counts: List[tuple] = []
+        for name, product_bitmap in self._products.items():
+            selected = bitmap & product_bitmap
+            if selected:
+                # NOTE: the lowest set bit is the first operation found for the product,
+                #       ordering by it keeps the same order a full scan would return.
+                counts.append(((selected & -selected).bit_length(), name, selected.bit_count()))
+        counts.sort()
+        return {name: count for _, name, count in counts}, scanned
+
+    def queryProduct(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> Tuple[Dict[str, int], int]:
+        """
+        Same as `query` (with a `product_name`) answered by checking each of the
+        operations of the product. Also returns the number of operations scanned.
+        """
+        numbers = list(bits(self._products.get(product_name, 0)))
+        return self._count(numbers, purchased, added, above, below, product_name), len(numbers)
+
+    def queryPrice(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> Tuple[Dict[str, int], int]:
+        """
+        Same as `query` (with `above` and/or `below`) answered by checking each of
+        the operations inside the price band (found by binary search over the
+        operations sorted by price). Also returns the number of operations scanned.
+        """
+        numbers = self._priceBand(above, below)
+        return self._count(numbers, purchased, added, above, below, product_name), len(numbers)
+
+    def select(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> List[int]:
+        """
+        Returns the numbers (in order) of the operations matching the filters
+        of `query`.
+        """
+        return list(bits(self._selection(purchased, added, above, below, product_name)[0]))
+
+    def columns(self) -> Dict[str, memoryview]:
+        """
+        Returns read-only views of the per operation columns (`price`, `product`
+        code, `flags` and `user` index), indexed by operation number.
+
+        Note
+        ----
+
+        The views share the memory of the index (nothing is copied), the columns
+        are never resized while they are in use: a copy of this index extended
+        afterwards appends to its own columns (see `copy`). Product
+        codes index `productNames` and flags have bit 1 set for added operations
+        and bit 2 for purchased ones.
+        """
+        with self._exports.Lock:
+            self._exports.Exported = True
+            return {
+                PRICE: memoryview(self._prices)[:self._size].toreadonly(),
+                PRODUCT: memoryview(self._codes)[:self._size].toreadonly(),
+                FLAGS: memoryview(self._flags)[:self._size].toreadonly(),
+                USER: memoryview(self._users)[:self._size].toreadonly(),
+            }
+
+    def productNames(self) -> List[str]:
+        """
+        Returns the product names by product code.
+        """
+        return list(self._names)
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        Returns the statistics used by the query planner: number of operations
+        (`size`), operations per flags (`(added, purchased)` tuples), per product
+        and per price bucket (an histogram with `bucket_width`).
+        """
+        if self._statistics is None:
+            flags = {}
+            for added, added_bitmap in self._added.items():
+                for purchased, purchased_bitmap in self._purchased.items():
+                    flags[(added, purchased)] = (added_bitmap & purchased_bitmap).bit_count()
+            self._statistics = {
+                "size": self._size,
+                "bucket_width": self._bucket_width,
+                "flags": flags,
+                "products": {name: bitmap.bit_count() for name, bitmap in self._products.items()},
+                "buckets": {bucket: bitmap.bit_count() for bucket, bitmap in sorted(self._buckets.items())},
+            }
+        return self._statistics
+
+    def dictionary(self) -> Dict[str, Any]:
+        """
+        Returns the information on this class in a form compatible
+        with writing to a json file.
+        """
+        return {
+            "bucket_width": self._bucket_width,
+            "size": self._size,
+            "prices": self._prices[:self._size].tolist(),
+            "users": self._encode(int.from_bytes(self._users[:self._size].tobytes(), "little")),
+            ADDED: {str(key): self._encode(value) for key, value in self._added.items()},
+            PURCHASED: {str(key): self._encode(value) for key, value in self._purchased.items()},
+            "products": {key: self._encode(value) for key, value in self._products.items()},
+            "buckets": {str(key): self._encode(value) for key, value in self._buckets.items()},
+        }
+
+    def _truncateColumns(self, size: int) -> None:
+        """
+        Drops the operations after `size` from the per operation columns.
+
+        Note
+        ----
+
+        A copy sharing the columns might have been extended (and then discarded,
+        see `copy`). And a column can not be resized while a view of it is in
+        use, so once views were exported (see `columns`) this index gets its own
+        copy of the columns. Called holding the lock of the exports.
+        """
+        names = ("_prices", "_codes", "_flags", "_users")
+        if self._exports.Exported:
+            for name in names:
+                setattr(self, name, getattr(self, name)[:size])
+            self._exports = ColumnExports()
+        else:
+            for name in names:
+                del getattr(self, name)[size:]
+
+    def _selection(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> Tuple[int, int]:
+        """
+        Returns the bitmap of the operations matching the filters (and the number
+        of operations checked to refine the price band).
+        """
+        bitmap = self._added.get(added, 0) & self._purchased.get(purchased, 0)
+        if product_name:
+            bitmap &= self._products.get(product_name, 0)
+        scanned = 0
+        if bitmap and (above or below):
+            price_bitmap, scanned = self._priceBitmap(above, below)
+            bitmap &= price_bitmap
+        return bitmap, scanned
+
+    def _count(self, numbers: Iterable[int], purchased: bool, added: bool, above: int, below: int, product_name: str) -> Dict[str, int]:
+        """
+        Returns the number of operations per product, out of the given operation
+        numbers, that match all filters (ordered by their first operation).
+        """
+        if added not in (True, False) or purchased not in (True, False):
+            return {}
+        flags = (1 if added else 0) | (2 if purchased else 0)
+        code = self._names.index(product_name) if product_name in self._names else None
+        counts: Dict[int, List[int]] = {}
+        for number in numbers:
+            if self._flags[number] != flags:
+                continue
+            if product_name and self._codes[number] != code:
+                continue
+            price = self._prices[number]
+            if above and price < above:
+                continue
+            if below and price > below:
+                continue
+            if self._codes[number] in counts:
+                counts[self._codes[number]][1] += 1
+            else:
+                counts[self._codes[number]] = [number, 1]
+        ordered = sorted((first, code, count) for code, (first, count) in counts.items())
+        return {self._names[code]: count for _, code, count in ordered}
+
+    def _priceBand(self, above: int, below: int) -> List[int]:
+        """
+        Returns the numbers of the operations inside the price band.
+
+        Note
+        ----
+
+        The operations are sorted by price once. Operations added afterwards go
+        into a small sorted pending list (as in `SortedPrices`) that is merged
+        into the sorted ones once it grows past the square root of their number,
+        so an index extended after a copy does not sort everything again.
+        """
+        if self._price_order is None:
+            self._sortPrices()
+        numbers: List[int] = []
+        for order, prices in ((self._price_order, self._sorted_prices), (self._pending_order, self._pending_prices)):
+            first = bisect.bisect_left(prices, above) if above else 0
+            last = bisect.bisect_right(prices, below) if below else len(prices)
+            numbers.extend(order[first:last])
+        return numbers
+
+    def _sortPrices(self) -> None:
+        """
+        Sorts all operations by price (merging the pending ones).
+        """
+        # NOTE: both lists are already sorted, so sorting them together is
+        #       just a merge.
+        numbers = self._price_order + self._pending_order if self._price_order is not None else range(self._size)
+        self._price_order = sorted(numbers, key=self._prices.__getitem__)
+        self._sorted_prices = [self._prices[number] for number in self._price_order]
+        self._pending_order = []
+        self._pending_prices = []
+
+    def _priceBitmap(self, above: int, below: int) -> Tuple[int, int]:
+        """
+        Returns the bitmap of all operations inside the price band (and the number
+        of operations checked). Buckets fully inside the band are OR-ed directly,
+        the ones crossing a bound are refined by checking the price of each of
+        their operations.
+        """
+        bitmap = 0
+        scanned = 0
+        for bucket, bucket_bitmap in self._buckets.items():
+            low = bucket * self._bucket_width
+            high = low + self._bucket_width
+            if (above and high <= above) or (below and low > below):
+                continue
+            if (not above or low >= above) and (not below or high <= below):
+                bitmap |= bucket_bitmap
+                continue
+            refined = bytearray((self._size + 7) // 8)
+            for number in bits(bucket_bitmap):
+                scanned += 1
+                price = self._prices[number]
+                if not (above and price < above) and not (below and price > below):
+                    refined[number >> 3] |= 1 << (number & 7)
+            bitmap |= int.from_bytes(refined, "little")
+        return bitmap, scanned
+
+    def _bucket(self, price: float) -> int:
+        """
+        Returns the price bucket in which the price falls.
+        """
+        return int(price // self._bucket_width)
+
+    def _encode(self, bitmap: int) -> str:
+        """
+        Compresses a bitmap into a string that can be written into a json file.
+        """
+        raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+        return base64.b64encode(zlib.compress(raw)).decode("ascii")
+
+    def _decodeBytes(self, string: str, length: int) -> bytes:
+        """
+        Converts a string produced by `_encode` back into (`length`) bytes.
+        """
+        return self._decode(string).to_bytes(length, "little")
+
+    def _decode(self, string: str) -> int:
+        """
+        Converts a string produced by `_encode` back into a bitmap.
+        """
+        return int.from_bytes(zlib.decompress(base64.b64decode(string)), "little")
+
+    def _buildIndexFromDictionary(self, dictionary: Dict[str, Any]) -> None:
+        """
+        Restores the bitmaps from a dictionary (coming from a json file) with
+        the format given by the `dictionary` method.
+        """
+        self._bucket_width = dictionary["bucket_width"]
+        self._size = dictionary["size"]
+        self._prices = array("d", dictionary["prices"])
+        self._users = array("i")
+        self._users.frombytes(self._decodeBytes(dictionary["users"], 4 * self._size))
+        self._added = {key == str(True): self._decode(value) for key, value in dictionary[ADDED].items()}
+        self._purchased = {key == str(True): self._decode(value) for key, value in dictionary[PURCHASED].items()}
+        self._products = {key: self._decode(value) for key, value in dictionary["products"].items()}
+        self._buckets = {int(key): self._decode(value) for key, value in dictionary["buckets"].items()}
+        # NOTE: the per operation columns are not written to file, they are
+        #       recovered from the bitmaps.
+        self._names = list(self._products)
+        self._codes = array("i", bytes(4 * self._size))
+        for code, bitmap in enumerate(self._products.values()):
+            for number in bits(bitmap):
+                self._codes[number] = code
+        self._flags = array("B", bytes(self._size))
+        for number in bits(self._added.get(True, 0)):
+            self._flags[number] |= 1
+        for number in bits(self._purchased.get(True, 0)):
+            self._flags[number] |= 2
@@ -31,4 +31,52 @@ ADDED: str = "added"
 ABOVE: str = "above"
 BELOW: str = "below"
 USERID: str = "user_id"
-PRODUCTNAME: str = "product_name"
\ No newline at end of file
+USERNAME: str = "user_name"
+PRODUCTNAME: str = "product_name"
+APPROXIMATE: str = "approximate"
+DISTINCTUSERS: str = "distinct_users"
+MINCOUNT: str = "min_count"
+MINSPEND: str = "min_spend"
+TOP: str = "top"
+ORDERBY: str = "order_by"
+COUNT: str = "count"
+SPEND: str = "spend"
+MINSUPPORT: str = "min_support"
+MINCONFIDENCE: str = "min_confidence"
+MINLIFT: str = "min_lift"
+PARALLEL: str = "parallel"
+ANTECEDENT: str = "antecedent"
+CONSEQUENT: str = "consequent"
+SUPPORT: str = "support"
+CONFIDENCE: str = "confidence"
+LIFT: str = "lift"
+REVENUE: str = "revenue"
+MEAN: str = "mean"
+LOW: str = "low"
+HIGH: str = "high"
+EXPLAIN: str = "explain"
+PLAN: str = "plan"
+ESTIMATEDROWS: str = "estimated_rows"
+ACTUALROWS: str = "actual_rows"
+CANDIDATES: str = "candidates"
+RESULT: str = "result"
+SHARDS: str = "shards"
+
+ID_LOOKUP: str = "id_lookup"
+PRODUCT_PARTITION: str = "product_partition"
+PRICE_INDEX: str = "price_index"
+BITMAP_SCAN: str = "bitmap_scan"
+FULL_SCAN: str = "full_scan"
+
+BITMAP_INDEX: str = "bitmap_index"
+FINGERPRINT: str = "fingerprint"
+
+USER: str = "user"
+OPERATION: str = "operation"
+PRODUCT: str = "product"
+PRICE: str = "price"
+FLAGS: str = "flags"
+REMOVED: str = "removed"
+USERIDS: str = "user_ids"
+OPERATIONIDS: str = "operation_ids"
+PRODUCTNAMES: str = "product_names"
@@ -0,0 +1,181 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+
+# Generic libraries
+from typing import Dict, Tuple, List, Iterable, Any
+from collections import Counter
+from array import array
+
+# Local libraries
+from .CommonVariables import *
+from .BitmapIndex import bits
+from .HistoryContainer import Operation
+
+
+def countBaskets(users: array, codes: array) -> Tuple[Dict[int, int], Dict[int, int], Dict[Tuple[int, int], int]]:
+    """
+    Counts baskets from the user (index) and product code of each operation,
+    returning the basket of each user (a bitmask of product codes), the number
+    of baskets with each product and the number of baskets with each pair of
+    products (as (lower code, higher code) tuples).
+
+    Note
+    ----
+
+    This is a module level function so that it can run in worker processes
+    (one per shard). Users buying the same products share a basket bitmask, so
+    pairs are enumerated once per distinct basket (weighted by how many users
+    have it) instead of once per user.
+    """
+    masks: Dict[int, int] = {}
+    for user, code in zip(users, codes):
+        masks[user] = masks.get(user, 0) | (1 << code)
+    items: Dict[int, int] = {}
+    pairs: Dict[Tuple[int, int], int] = {}
+    for mask, count in Counter(masks.values()).items():
+        basket = list(bits(mask))
+        for position, first in enumerate(basket):
+            items[first] = items.get(first, 0) + count
+            for second in basket[position + 1:]:
+                pairs[(first, second)] = pairs.get((first, second), 0) + count
+    return masks, items, pairs
+
+
+class CooccurrenceIndex:
+    """
+    The `CooccurrenceIndex` counts which products end up together in the same
+    basket: the distinct products of the operations of a user matching the
+    filters (`purchased`, `added`, `above` and `below`). It keeps the number of
+    baskets, the number of baskets with each product and with each pair of
+    products, from which the support, confidence and lift of the associations
+    between products are computed.
+
+    Products are coded as integers (their position in `_names`) and each basket
+    is kept as a bitmask of product codes, so a new operation only updates the
+    pairs of its product with the products already in the basket of the user.
+    """
+    _filters: Dict[str, Any] = None
+    _names: List[str] = None
+    _codes: Dict[str, int] = None
+    _masks: Dict[str, int] = None
+    _items: Dict[int, int] = None
+    _pairs: Dict[Tuple[int, int], int] = None
+    def __init__(self, filters: Dict[str, Any], names: Iterable[str] = ()) -> None:
+        self._filters = dict(filters)
+        self._names = list(names)
+        self._codes = {name: code for code, name in enumerate(self._names)}
+        self._masks = {}
+        self._items = {}
+        self._pairs = {}
+
+    def merge(self, user_ids: List[str], masks: Dict[int, int], items: Dict[int, int], pairs: Dict[Tuple[int, int], int]) -> None:
+        """
+        Adds the baskets counted (by `countBaskets`) over a shard with the same
+        product codes as this index. Users are partitioned between shards so
+        the counts just add up.
+        """
+        for user, mask in masks.items():
+            self._masks[user_ids[user]] = mask
+        for code, count in items.items():
+            self._items[code] = self._items.get(code, 0) + count
+        for pair, count in pairs.items():
+            self._pairs[pair] = self._pairs.get(pair, 0) + count
+
+    def add(self, user_id: str, operation: Operation) -> None:
+        """
+        Updates the counts with a new operation of the user (if it matches the
+        filters and its product is not in the basket of the user yet).
+        """
+        filters = self._filters
+        if not operation.matches(purchased=filters[PURCHASED], added=filters[ADDED], above=filters[ABOVE], below=filters[BELOW], product_name=None):
+            return
+        if operation.Name not in self._codes:
+            self._codes[operation.Name] = len(self._names)
+            self._names.append(operation.Name)
+        code = self._codes[operation.Name]
+        mask = self._masks.get(user_id, 0)
+        if mask >> code & 1:
+            return
+        for other in bits(mask):
+            pair = (other, code) if other < code else (code, other)
+            self._pairs[pair] = self._pairs.get(pair, 0) + 1
+        self._items[code] = self._items.get(code, 0) + 1
+        self._masks[user_id] = mask | (1 << code)
+
+    def baskets(self) -> int:
+        """
+        Returns the number of baskets (users with at least one operation
+        matching the filters).
+        """
+        return len(self._masks)
+
+    def pairCounts(self) -> Dict[Tuple[str, str], int]:
+        """
+        Returns the number of baskets with each pair of products (each pair
+        once, with the names in alphabetical order), most frequent first.
+        """
+        counts = {tuple(sorted((self._names[first], self._names[second]))): count for (first, second), count in self._pairs.items()}
+        return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+    def associations(self, product_name: str = None, min_count: int = None, min_support: float = None, min_confidence: float = None, min_lift: float = None, order_by: str = LIFT, top: int = None) -> List[Dict[str, Any]]:
+        """
+        Returns the associations between products (both directions of each pair)
+        with the number of baskets with both (`count`), their `support` (fraction
+        of baskets with both), `confidence` (fraction of the baskets with the
+        `antecedent` that also have the `consequent`) and `lift` (confidence over
+        the support of the consequent, above 1 when they are bought together more
+        often than by chance).
+
+        The associations can be limited to one `antecedent` (`product_name`) and
+        by minimum values, and are ordered by `order_by` (biggest first), keeping
+        the `top` ones.
+        """
+        baskets = len(self._masks)
+        associations: List[Dict[str, Any]] = []
+        for (first, second), count in self._pairs.items():
+            for antecedent, consequent in ((first, second), (second, first)):
+                if product_name and self._names[antecedent] != product_name:
+                    continue
+                confidence = count / self._items[antecedent]
+                association = {
+                    ANTECEDENT: self._names[antecedent],
+                    CONSEQUENT: self._names[consequent],
+                    COUNT: count,
+                    SUPPORT: count / baskets,
+                    CONFIDENCE: confidence,
+                    LIFT: confidence * baskets / self._items[consequent],
+                }
+                if min_count is not None and count < min_count:
+                    continue
+                if min_support is not None and association[SUPPORT] < min_support:
+                    continue
+                if min_confidence is not None and confidence < min_confidence:
+                    continue
+                if min_lift is not None and association[LIFT] < min_lift:
+                    continue
+                associations.append(association)
+        associations.sort(key=lambda association: (-association[order_by], association[ANTECEDENT], association[CONSEQUENT]))
+        return associations[:top] if top is not None else associations
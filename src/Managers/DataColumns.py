@@ -0,0 +1,202 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+
+# Generic libraries
+from typing import Dict, List, Any, BinaryIO
+from array import array
+import bisect
+import zipfile
+import struct
+import sys
+import os
+
+# Local libraries
+from .CommonVariables import *
+from .DataVersion import DataVersion
+from .DataShard import DataShard
+from .HistoryContainer import Operation
+
+
+NPY_MAGIC: bytes = b"\x93NUMPY\x01\x00"
+NPY_KINDS: Dict[str, str] = {
+    "f": "f", "d": "f",
+    "b": "i", "h": "i", "i": "i", "l": "i", "q": "i",
+    "B": "u", "H": "u", "I": "u", "L": "u", "Q": "u",
+}
+ADDED_TABLE: bytes = bytes(flags & 1 for flags in range(256))
+PURCHASED_TABLE: bytes = bytes((flags >> 1) & 1 for flags in range(256))
+
+
+def buildColumns(version: DataVersion, filters: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Returns the operations of a version (all of them, or the ones matching the
+    `filters` of `DataManager.query`) as flat columns, one value per operation:
+
+    - `user`: index of the user in `user_ids` (int32).
+    - `operation`: number of the operation (int64), its id is in `operation_ids`.
+    - `product`: index of the product in `product_names` (int32).
+    - `price`: price of the operation (float64).
+    - `added` and `purchased`: flags, 0 or 1 (uint8).
+    - `flags`: both flags in one value, bit 1 added and bit 2 purchased (uint8).
+    - `removed`: number of the operation removed by this one, -1 if none (int64).
+
+    Note
+    ----
+
+    Columns are buffer objects (`memoryview`, `array` or `bytes`). For a single
+    shard with no filters the `user`, `product`, `price` and `flags` columns are
+    read-only views of the bitmap index storage, nothing is copied. Otherwise the
+    selected operations are gathered, renumbering products and users globally.
+    """
+    shared = filters is None and len(version.Shards) == 1
+    columns: Dict[str, Any] = {
+        USER: array("i"),
+        OPERATION: array("q"),
+        PRODUCT: array("i"),
+        PRICE: array("d"),
+        FLAGS: array("B"),
+    }
+    user_ids: List[str] = []
+    operation_ids: List[str] = []
+    removed: List[int] = []
+    codes: Dict[str, int] = {}
+    user_offset = 0
+    operation_offset = 0
+    for shard in version.Shards:
+        bitmap_index = shard.BitmapIndex
+        views = bitmap_index.columns()
+        user_ids.extend(user_data.id() for user_data in shard.UsersData)
+        numbers = _select(shard, version, filters)
+        if shared:
+            columns.update(views)
+            columns[OPERATION] = array("q", range(bitmap_index.size()))
+        else:
+            remap = [codes.setdefault(name, len(codes)) for name in bitmap_index.productNames()]
+            columns[USER].extend(views[USER][number] + user_offset for number in numbers)
+            columns[OPERATION].extend(number + operation_offset for number in numbers)
+            columns[PRODUCT].extend(remap[views[PRODUCT][number]] for number in numbers)
+            columns[PRICE].extend(views[PRICE][number] for number in numbers)
+            columns[FLAGS].extend(views[FLAGS][number] for number in numbers)
+        # NOTE: operations are numbered in the order they were added, so the n-th
+        #       number of a user is the n-th operation of its history. Only the
+        #       histories of the users of the selected operations are read.
+        selected_users = {views[USER][number] for number in numbers}
+        user_numbers: Dict[int, List[int]] = {user: [] for user in selected_users}
+        for number, user in enumerate(views[USER]):
+            if user in user_numbers:
+                user_numbers[user].append(number)
+        histories: Dict[int, List[Operation]] = {}
+        positions: Dict[int, Dict[str, int]] = {}
+        for number in numbers:
+            user = views[USER][number]
+            if user not in histories:
+                histories[user] = list(shard.UsersData[user].history())
+                positions[user] = {operation.Id: position for position, operation in enumerate(histories[user])}
+            operation = histories[user][bisect.bisect_left(user_numbers[user], number)]
+            operation_ids.append(operation.Id)
+            # NOTE: an operation can only remove an operation of the same user.
+            position = positions[user].get(operation.RemovedId) if operation.RemovedId else None
+            removed.append(operation_offset + user_numbers[user][position] if position is not None else -1)
+        user_offset += len(shard.UsersData)
+        operation_offset += bitmap_index.size()
+    flags = bytes(columns[FLAGS])
+    columns[ADDED] = flags.translate(ADDED_TABLE)
+    columns[PURCHASED] = flags.translate(PURCHASED_TABLE)
+    columns[REMOVED] = array("q", removed)
+    columns[USERIDS] = user_ids
+    columns[OPERATIONIDS] = operation_ids
+    columns[PRODUCTNAMES] = list(codes) if not shared else version.Shards[0].BitmapIndex.productNames()
+    return columns
+
+
+def writeNpy(fid: BinaryIO, column: Any) -> None:
+    """
+    Writes a column (a buffer object or a list of strings) into a binary file
+    object in the `.npy` format (version 1.0), readable with `numpy.load`.
+    """
+    if isinstance(column, list):
+        width = max((len(value) for value in column), default=0) or 1
+        descr = "<U" + str(width)
+        length = len(column)
+        data = b"".join(value.encode("utf-32-le").ljust(4 * width, b"\0") for value in column)
+    else:
+        data = memoryview(column)
+        descr = _npyDescr(data.format, data.itemsize)
+        length = len(data)
+    header = "{'descr': '" + descr + "', 'fortran_order': False, 'shape': (" + str(length) + ",), }"
+    # NOTE: the header is padded so that the data starts aligned to 64 bytes
+    #       (as written by numpy, so the file can be memory mapped).
+    header += " " * (-(len(NPY_MAGIC) + 2 + len(header) + 1) % 64) + "\n"
+    fid.write(NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1"))
+    fid.write(data)
+
+
+def writeColumns(path: str, columns: Dict[str, Any], compressed: bool = False) -> List[str]:
+    """
+    Writes the columns into a `.npz` archive (one `.npy` per column, deflated
+    if `compressed`) or, for any other path, into a directory with one `.npy`
+    file per column. Returns the paths written.
+    """
+    if path.endswith(".npz"):
+        compression = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+        with zipfile.ZipFile(path, "w", compression) as archive:
+            for name, column in columns.items():
+                with archive.open(name + ".npy", "w", force_zip64=True) as fid:
+                    writeNpy(fid, column)
+        return [path]
+    os.makedirs(path, exist_ok=True)
+    paths: List[str] = []
+    for name, column in columns.items():
+        paths.append(os.path.join(path, name + ".npy"))
+        with open(paths[-1], "wb") as fid:
+            writeNpy(fid, column)
+    return paths
+
+
+def _select(shard: DataShard, version: DataVersion, filters: Dict[str, Any]) -> Any:
+    """
+    Returns the numbers of the operations of the shard matching the filters.
+    """
+    if filters is None:
+        return range(shard.BitmapIndex.size())
+    user_id = filters[USERID]
+    if user_id and version.shard(user_id) is not shard:
+        return []
+    numbers = shard.BitmapIndex.select(**{key: value for key, value in filters.items() if key != USERID})
+    if user_id:
+        index = shard.UsersIndex.get(user_id)
+        users = shard.BitmapIndex.columns()[USER]
+        numbers = [number for number in numbers if users[number] == index]
+    return numbers
+
+
+def _npyDescr(format: str, itemsize: int) -> str:
+    """
+    Returns the numpy type description of a buffer format (`d` is `<f8`).
+    """
+    if itemsize == 1:
+        return "|" + NPY_KINDS[format] + "1"
+    return ("<" if sys.byteorder == "little" else ">") + NPY_KINDS[format.lstrip("@=<>!")] + str(itemsize)
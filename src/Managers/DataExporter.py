@@ -0,0 +1,170 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+# Generic libraries
+from typing import List, Iterable, Iterator, Any, TextIO
+import json
+import gzip
+import zlib
+import os
+
+# Local libraries
+from .UserData import UserData
+
+
+GZIP: str = "gzip"
+ZLIB: str = "zlib"
+
+
+class ZlibFile:
+    """
+    Minimal text file writer compressing its content with zlib (the `zlib`
+    module has no file object of its own, unlike `gzip`).
+    """
+    _fid = None
+    _compressor = None
+    def __init__(self, path: str) -> None:
+        self._fid = open(path, "wb")
+        self._compressor = zlib.compressobj()
+
+    def write(self, text: str) -> int:
+        self._fid.write(self._compressor.compress(text.encode("utf-8")))
+        return len(text)
+
+    def close(self) -> None:
+        self._fid.write(self._compressor.flush())
+        self._fid.close()
+
+    def __enter__(self) -> "ZlibFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class DataExporter:
+    """
+    The `DataExporter` writes users into json one user at a time, so the memory
+    needed does not grow with the dataset (as opposed to `json.dumps` over the
+    `DataManager.dictionary()`).
+
+    The output can be indented (`indent`, same output as `json.dumps`) or compact
+    (`indent=None`), compressed (`compression` either `gzip` or `zlib`) and split
+    into several files (`users_per_file`).
+    """
+    _indent: int = None
+    _compression: str = None
+    _users_per_file: int = None
+    def __init__(self, indent: int = None, compression: str = None, users_per_file: int = None) -> None:
+        if compression not in (None, GZIP, ZLIB):
+            raise ValueError("Unknown compression: " + str(compression) + " (use gzip or zlib).")
+        if users_per_file is not None and users_per_file < 1:
+            raise ValueError("users_per_file must be at least 1.")
+        self._indent = indent
+        self._compression = compression
+        self._users_per_file = users_per_file
+
+    def write(self, fid: TextIO, users: Iterable[UserData]) -> int:
+        """
+        Writes the users as a json object into a text file object. Returns the
+        number of users written.
+        """
+        count = 0
+        fid.write("{")
+        for user_data in users:
+            self._item(fid, user_data.id(), user_data.dictionary(), count == 0)
+            count += 1
+        if self._indent is not None and count:
+            fid.write("\n")
+        fid.write("}")
+        return count
+
+    def export(self, path: str, users: Iterable[UserData]) -> List[str]:
+        """
+        Writes the users into one file (or several with `users_per_file`) and
+        returns the paths written. Chunks are numbered (`users.json` becomes
+        `users.0.json`, `users.1.json`, ...) and compressed files get a `.gz`
+        or `.zz` extension.
+        """
+        users = iter(users)
+        paths: List[str] = []
+        first = next(users, None)
+        while first is not None or not paths:
+            chunk_path = self._path(path, len(paths))
+            with self._open(chunk_path) as fid:
+                self.write(fid, self._chunk(first, users) if first is not None else [])
+            paths.append(chunk_path)
+            first = next(users, None)
+        return paths
+
+    def _item(self, fid: TextIO, key: str, value: Any, first: bool) -> None:
+        """
+        Writes a single key of the top level json object.
+        """
+        if self._indent is None:
+            fid.write(("" if first else ",") + json.dumps(key) + ":" + json.dumps(value, separators=(",", ":")))
+            return
+        padding = "\n" + " " * self._indent
+        text = json.dumps(value, indent=self._indent).replace("\n", padding)
+        fid.write(("" if first else ",") + padding + json.dumps(key) + ": " + text)
+
+    def _chunk(self, first: UserData, users: Iterator[UserData]) -> Iterator[UserData]:
+        """
+        Yields the first user followed by the next ones, up to `users_per_file`
+        users (or all of them).
+        """
+        yield first
+        count = 1
+        # NOTE: the limit is checked before taking the next user, otherwise
+        #       that user would be consumed (and lost) or go over the limit.
+        while self._users_per_file is None or count < self._users_per_file:
+            user_data = next(users, None)
+            if user_data is None:
+                return
+            yield user_data
+            count += 1
+
+    def _path(self, path: str, chunk: int) -> str:
+        """
+        Returns the path of a chunk (with the extension of the compression).
+        """
+        if self._users_per_file is not None:
+            root, extension = os.path.splitext(path)
+            path = root + "." + str(chunk) + extension
+        if self._compression == GZIP:
+            path += ".gz"
+        elif self._compression == ZLIB:
+            path += ".zz"
+        return path
+
+    def _open(self, path: str):
+        """
+        Opens a text file for writing with the compression chosen.
+        """
+        if self._compression == GZIP:
+            return gzip.open(path, "wt", encoding="utf-8")
+        if self._compression == ZLIB:
+            return ZlibFile(path)
+        return open(path, "w")
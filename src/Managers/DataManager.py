@@ -24,16 +24,31 @@ SOFTWARE.
 
 
 # Generic libraries
-from typing import Dict, Tuple, List, Any
+from typing import Dict, Tuple, List, Iterable, Union, Callable, AsyncIterator, Any, TextIO
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from array import array
+import threading
 import json
+import io
+import os
 
 # Utilities libraries
-from src.Utils import SingletonMetaClass
+from src.Utils import SingletonMetaClass, deepsizeof
 
 # Local libraries
 from .CommonVariables import *
 from .UserData import UserData, User
-from .HistoryContainer import HistoryContainer
+from .HistoryContainer import HistoryContainer, Operation
+from .HistoryCache import HistoryCache
+from .DataVersion import DataVersion
+from .DataShard import DataShard, shardOf, shardFileName, indexFileName, fingerprint, loadShard
+from .QueryPlanner import QueryPlanner
+from .DataExporter import DataExporter
+from .DataColumns import buildColumns, writeColumns
+from .MaterializedView import MaterializedView
+from .CooccurrenceIndex import CooccurrenceIndex, countBaskets
+from .PriceIndex import SortedPrices, priceBand, kth
 
 
 class DataManager(metaclass=SingletonMetaClass):
@@ -41,27 +56,63 @@ class DataManager(metaclass=SingletonMetaClass):
     The `DataManager` is the class responsible for loading all data from file.
     From it you can make queries with specific keywords. Those being `purchased`,
     `added` (use `False` if you want removed items), `above` and `below` (integers),
-    `product_name`, or `user_id`.
+    `product_name`, or `user_id`. With `approximate` the query is answered from
+    small sketches instead (see `SketchIndex`).
+
+    The data can be split into `shards` files (`users.json` becomes `users.0-of-4.json`,
+    `users.1-of-4.json`, ...) with each user in the shard given by the hash of its id.
+    Shards are loaded in parallel worker processes, lookups by id go to the shard
+    owning the user and queries over all users go to all shards and are merged.
 
     You can obtain directly a User by using the methods `userById` which returns
     an unique user. Or the method `userByName` which returns a list of users (more
     than one can exist with the same name; only the id is unique).
 
+    An optional `memory_budget` (in bytes) limits the memory used by the user
+    histories. The least recently used ones are evicted to a spill file (next to
+    the manager data file) and reloaded when needed. Use `memoryUsage` and
+    `cacheStatistics` to choose the budget.
+
     Note
     ----
 
     This class was a made a singleton so that it can be added to an external software
     with ease. Once the first instantiation is done, all others will refer to the same
     data.
+
+    All data is kept in an immutable `DataVersion`. Reads (from any number of
+    threads) use the version current when they start, without locking. Writes
+    (`_load` and `addOperations`) are serialized, build the next version and
+    swap it in atomically, so readers never see torn results.
+
+    Queries polled over and over can be registered as materialized views
+    (`createView`), which are updated with each write and read with `view`.
+    Products found together in the same user basket are counted with `pairCounts`
+    and `associations` (market basket analysis).
     """
     _user_data_file: str = None
     _manager_data_file: str = None
-    _raw_user_data: Dict[int, Dict[str, Any]] = None
-    _users_data: List[UserData] = []
+    _memory_budget: int = None
+    _shards: int = None
+    _version: DataVersion = None
+    _write_lock: threading.Lock = None
+    _planner: QueryPlanner = None
+    _operations_during_load: List[Tuple[str, str, str, float, bool, bool, str]] = None
+    _views: Dict[str, MaterializedView] = None
+    _cooccurrence_indexes: "OrderedDict[Tuple[bool, bool, int, int], CooccurrenceIndex]" = None
+    _cooccurrence_limit: int = 8
+    _loads: int = None
 
-    def __init__(self, user_data_file: str, manager_data_file: str) -> None:
+    def __init__(self, user_data_file: str, manager_data_file: str, memory_budget: int = None, shards: int = 1) -> None:
         self._user_data_file = user_data_file
         self._manager_data_file = manager_data_file
+        self._memory_budget = memory_budget
+        self._shards = shards
+        self._write_lock = threading.Lock()
+        self._planner = QueryPlanner()
+        self._views = {}
+        self._cooccurrence_indexes = OrderedDict()
+        self._loads = 0
         self._load()
 
     def userById(self, id: str):
@@ -70,12 +121,18 @@ class DataManager(metaclass=SingletonMetaClass):
         """
         return self._id(id).user()
     
+    def userIds(self) -> List[str]:
+        """
+        Returns the ids of all users.
+        """
+        return [user_data.id() for user_data in self._version.usersData()]
+
     def userByName(self, name: str) -> List[User]:
         """
         Return a list of users with the provided name (first and last names in a string).
         """
         users: List[User] = []
-        for user_data in self._users_data:
+        for user_data in self._version.usersData():
             if user_data.name() == name:
                 users.append(user_data.user())
         return users
@@ -86,12 +143,503 @@ class DataManager(metaclass=SingletonMetaClass):
         """
         return self._id(id).history()
 
+    def addOperation(self, user_id: str, id: str, name: str, price: float, added: bool, purchased: bool, removed_id: str = None) -> Operation:
+        """
+        Ingests a new operation into the history of the user and updates all
+        indexes with it.
+        """
+        return self.addOperations([(user_id, id, name, price, added, purchased, removed_id)])[0]
+
+    def addOperations(self, operations: List[Tuple[str, str, str, float, bool, bool, str]]) -> List[Operation]:
+        """
+        Ingests several operations, given as (user id, operation id, name, price,
+        added, purchased, removed id) tuples, in a single new version.
+
+        Note
+        ----
+
+        Only the shards and histories of the users involved are copied (along
+        with the list of users and the indexes of those shards), the rest is
+        shared with the previous version. Ingesting in batches makes that copy
+        once per batch.
+        """
+        with self._write_lock:
+            version, result, ingested = self._ingest(self._version, operations)
+            self._version = version
+            if self._operations_during_load is not None:
+                self._operations_during_load.extend(operations)
+            changes: List[Tuple[MaterializedView, Dict[str, int]]] = []
+            for view in self._views.values():
+                view_result = view.apply(ingested)
+                if view_result is not None:
+                    changes.append((view, view_result))
+            for cooccurrence_index in self._cooccurrence_indexes.values():
+                for user_id, operation in ingested:
+                    cooccurrence_index.add(user_id, operation)
+        # NOTE: subscribers are notified once the lock is released, so they
+        #       can read from (or write to) the manager themselves.
+        for view, view_result in changes:
+            view.notify(view_result, version.Number)
+        return result
+
     def query(self, **kwargs) -> Dict[str, int]:
         """
         Returns a dictionary with the query made for the `purchase` and
         `added` flags for all users.
+
+        Note
+        ----
+
+        With `approximate=True` the result is a dictionary of (estimate, error)
+        tuples per product taken from the sketches. Only the `purchased`, `added`
+        and `product_name` filters can be used with it. Adding `distinct_users=True`
+        estimates the number of distinct users instead of the number of operations.
+
+        With `explain=True` the result is a dictionary with the access path chosen
+        by the `QueryPlanner` (`plan`), its estimated and actual number of operations
+        scanned, the estimates for all candidate paths and the query `result`.
+        """
+        filters = self._filters(**kwargs)
+        if kwargs.get(APPROXIMATE):
+            if filters[USERID] or filters[ABOVE] or filters[BELOW]:
+                raise ValueError("Approximate queries can not be limited by user id or price.")
+            # NOTE: users are partitioned between shards so both estimates
+            #       and error bounds of the shards add up.
+            dictionary: Dict[str, Tuple[int, int]] = {}
+            for shard in self._version.Shards:
+                estimates = shard.SketchIndex.query(purchased=filters[PURCHASED], added=filters[ADDED], product_name=filters[PRODUCTNAME], distinct_users=bool(kwargs.get(DISTINCTUSERS)))
+                for key, (estimate, error) in estimates.items():
+                    previous_estimate, previous_error = dictionary.get(key, (0, 0))
+                    dictionary[key] = (previous_estimate + estimate, previous_error + error)
+            return dictionary
+        if kwargs.get(EXPLAIN):
+            return self._explain(**filters)
+        return self._query(**filters)
+
+    def groupByUser(self, **kwargs) -> Dict[str, Dict[str, float]]:
+        """
+        Returns a dictionary with the number of operations (`count`) and their
+        total price (`spend`) per user id, for the same filters as `query`.
+
+        Note
+        ----
+
+        The result can be limited with `min_count` and `min_spend` (as in a SQL
+        `HAVING`) and with `top` (the N users with the biggest `order_by` value,
+        either `count` or `spend`). Everything is computed in a single pass over
+        the users.
+        """
+        filters = self._filters(**kwargs)
+        user_id = filters.pop(USERID)
+        order_by = kwargs.get(ORDERBY, COUNT)
+        if order_by not in (COUNT, SPEND):
+            raise ValueError("Unknown order_by: " + str(order_by) + " (use count or spend).")
+        min_count = kwargs.get(MINCOUNT)
+        min_spend = kwargs.get(MINSPEND)
+        version = self._version
+        users_data = [self._id(user_id, version)] if user_id else version.usersData()
+        dictionary: Dict[str, Dict[str, float]] = {}
+        for user_data in users_data:
+            if user_data is None:
+                continue
+            count, spend = user_data.history().aggregate(**filters)
+            if count == 0:
+                continue
+            if min_count is not None and count < min_count:
+                continue
+            if min_spend is not None and spend < min_spend:
+                continue
+            dictionary[user_data.id()] = {COUNT: count, SPEND: spend}
+        if kwargs.get(TOP) is not None:
+            ranked = sorted(dictionary.items(), key=lambda item: item[1][order_by], reverse=True)
+            dictionary = dict(ranked[:kwargs[TOP]])
+        return dictionary
+
+    def createView(self, name: str, **kwargs) -> Dict[str, int]:
+        """
+        Registers a materialized view: a standing query (same keywords as `query`)
+        whose result is kept up to date as operations are ingested. Returns its
+        current result.
+
+        Note
+        ----
+
+        Approximate and explained queries can not be materialized.
+        """
+        if kwargs.get(APPROXIMATE) or kwargs.get(EXPLAIN):
+            raise ValueError("Approximate and explained queries can not be materialized.")
+        filters = self._filters(**kwargs)
+        with self._write_lock:
+            if name in self._views:
+                raise ValueError("A view named " + str(name) + " already exists.")
+            view = MaterializedView(name, filters, self._query(**filters), self._version.Number, self._write_lock)
+            views = dict(self._views)
+            views[name] = view
+            self._views = views
+        return view.result()
+
+    def dropView(self, name: str) -> None:
+        """
+        Removes a materialized view (its subscribers are no longer notified).
+        """
+        with self._write_lock:
+            views = dict(self._views)
+            if views.pop(name, None) is None:
+                raise ValueError("No such view exists: " + str(name))
+            self._views = views
+
+    def view(self, name: str) -> Dict[str, int]:
+        """
+        Returns the current result of a materialized view (without running the query).
+        """
+        return self._materializedView(name).result()
+
+    def views(self) -> List[str]:
+        """
+        Returns the names of the materialized views.
+        """
+        return list(self._views)
+
+    def subscribe(self, name: str, callback: Callable[[str, Dict[str, int]], None]) -> None:
+        """
+        Calls `callback(name, result)` every time the result of the view changes.
+        """
+        self._materializedView(name).subscribe(callback)
+
+    def unsubscribe(self, name: str, callback: Callable[[str, Dict[str, int]], None]) -> None:
+        """
+        Stops calling a callback registered with `subscribe`.
+        """
+        self._materializedView(name).unsubscribe(callback)
+
+    def watch(self, name: str) -> AsyncIterator[Dict[str, int]]:
+        """
+        Returns an async iterator yielding the result of the view, first the
+        current one and then every time it changes:
+
+        `async for result in dm.watch("removed_above_300"): ...`
+        """
+        return self._materializedView(name).watch()
+
+    def pairCounts(self, **kwargs) -> Dict[Tuple[str, str], int]:
+        """
+        Returns the number of user baskets with each pair of products, most
+        frequent first. A basket is made of the distinct products of the
+        operations of a user matching the `purchased`, `added`, `above` and
+        `below` filters (same as `query`).
+        """
+        cooccurrence_index = self._cooccurrenceIndex(**kwargs)
+        with self._write_lock:
+            return cooccurrence_index.pairCounts()
+
+    def associations(self, **kwargs) -> List[Dict[str, Any]]:
+        """
+        Returns the associations between products found in the same user basket
+        (see `pairCounts`): `antecedent`, `consequent`, number of baskets with both
+        (`count`), `support`, `confidence` and `lift` (see `CooccurrenceIndex`).
+
+        Note
+        ----
+
+        The associations can be limited to those of one `product_name` (as the
+        antecedent), to a `min_count`, `min_support`, `min_confidence` or `min_lift`
+        and to the `top` N ordered by `order_by` (`lift` by default).
+
+        The counts are built on the first call for each set of filters (with
+        `parallel=True` one worker process per shard) and then kept up to date
+        as operations are ingested.
+        """
+        order_by = kwargs.get(ORDERBY, LIFT)
+        if order_by not in (COUNT, SUPPORT, CONFIDENCE, LIFT):
+            raise ValueError("Unknown order_by: " + str(order_by) + " (use count, support, confidence or lift).")
+        cooccurrence_index = self._cooccurrenceIndex(**kwargs)
+        with self._write_lock:
+            return cooccurrence_index.associations(product_name=kwargs.get(PRODUCTNAME),
+                                                   min_count=kwargs.get(MINCOUNT),
+                                                   min_support=kwargs.get(MINSUPPORT),
+                                                   min_confidence=kwargs.get(MINCONFIDENCE),
+                                                   min_lift=kwargs.get(MINLIFT),
+                                                   order_by=order_by,
+                                                   top=kwargs.get(TOP))
+
+    def revenue(self, **kwargs) -> Dict[str, float]:
+        """
+        Returns the number of operations (`count`), the sum of their prices
+        (`revenue`) and their `mean` price, for the same filters as `query`.
+        """
+        scopes, above, below = self._priceScopes(**kwargs)
+        count, total = priceBand(scopes, above, below)
+        return {COUNT: count, REVENUE: total, MEAN: total / count if count else 0.0}
+
+    def priceQuantiles(self, quantiles: Iterable[float] = (0.25, 0.5, 0.75), **kwargs) -> Dict[float, float]:
+        """
+        Returns the price at each quantile (between 0 and 1, interpolated linearly
+        between the closest prices as `numpy.quantile` does) of the operations
+        matching the filters of `query` (`None` if there is none).
+        """
+        quantiles = list(quantiles)
+        for quantile in quantiles:
+            if not 0 <= quantile <= 1:
+                raise ValueError("Quantiles must be between 0 and 1: " + str(quantile))
+        scopes, above, below = self._priceScopes(**kwargs)
+        sequences = [sequence for sorted_prices in scopes for sequence in sorted_prices.sequences(above, below)]
+        count = sum(last - first for _, first, last in sequences)
+        dictionary: Dict[float, float] = {}
+        for quantile in quantiles:
+            if count == 0:
+                dictionary[quantile] = None
+                continue
+            position = quantile * (count - 1)
+            lower = int(position)
+            value = kth(sequences, lower)
+            if position > lower:
+                value += (kth(sequences, lower + 1) - value) * (position - lower)
+            dictionary[quantile] = value
+        return dictionary
+
+    def priceHistogram(self, bins: Union[int, List[float]] = 10, **kwargs) -> List[Dict[str, float]]:
+        """
+        Returns the histogram of the prices of the operations matching the filters
+        of `query`: the `low` and `high` price of each bin with the number of
+        operations (`count`) and the sum of their prices (`revenue`) in it.
+
+        Note
+        ----
+
+        `bins` is either the number of bins (of equal width, between `above` and
+        `below` or else the lowest and highest prices) or the list of their edges.
+        Each bin includes its `low` price, the last one also its `high` price.
+        """
+        scopes, above, below = self._priceScopes(**kwargs)
+        if isinstance(bins, int):
+            sequences = [sequence for sorted_prices in scopes for sequence in sorted_prices.sequences(above, below)]
+            count = sum(last - first for _, first, last in sequences)
+            if count == 0 or bins < 1:
+                return []
+            low = above if above is not None else kth(sequences, 0)
+            high = below if below is not None else kth(sequences, count - 1)
+            # NOTE: when every price is the same the bins would all be empty
+            #       but the last one, a single bin is returned instead.
+            edges = [low + (high - low) * bin / bins for bin in range(bins)] + [high] if low < high else [low, high]
+        else:
+            edges = sorted(bins)
+        histogram: List[Dict[str, float]] = []
+        for bin, (low, high) in enumerate(zip(edges[:-1], edges[1:])):
+            first = max(low, above) if above is not None else low
+            last = min(high, below) if below is not None else high
+            # NOTE: a bin cut by `below` ends at it, so it includes it (the bins
+            #       after it are empty).
+            inclusive = bin == len(edges) - 2 or (below is not None and high > below)
+            count, total = priceBand(scopes, first, last, inclusive) if first <= last else (0, 0.0)
+            histogram.append({LOW: low, HIGH: high, COUNT: count, REVENUE: total})
+        return histogram
+
+    def memoryUsage(self) -> Dict[str, int]:
+        """
+        Returns an estimate of the memory (in bytes) used by each structure of
+        the manager: `users` (names and ids), `histories` (containers only),
+        `operations` (in memory, spilled ones excluded) and `indexes`.
+        """
+        # NOTE: the manager and the history cache (with its spill file) are
+        #       marked as seen so that the references users keep to them are
+        #       not followed (the cache reaches the histories of other users).
+        version = self._version
+        seen = {id(self), id(version.HistoryCache), id(version.HistoryCache._spill_file)}
+        users = 0
+        histories = 0
+        operations = 0
+        for user_data in version.usersData():
+            history = user_data._history
+            seen.add(id(history))
+            users += deepsizeof(user_data, seen)
+            if history is None:
+                continue
+            seen.discard(id(history))
+            for operation in history:
+                operations += deepsizeof(operation, seen)
+            histories += deepsizeof(history, seen)
+        indexes = 0
+        for shard in version.Shards:
+            indexes += deepsizeof(shard.UsersData, seen) + deepsizeof(shard.UsersIndex, seen)
+            indexes += deepsizeof(shard.BitmapIndex, seen) + deepsizeof(shard.SketchIndex, seen)
+            indexes += deepsizeof(shard.PriceIndex, seen)
+        return {"users": users, "histories": histories, "operations": operations, "indexes": indexes}
+
+    def cacheStatistics(self) -> Dict[str, Any]:
+        """
+        Returns the statistics of the history cache (hits, misses, hit rate,
+        evictions and bytes in memory and on disk).
+        """
+        return self._version.HistoryCache.statistics()
+
+    def _ingest(self, version: DataVersion, operations: List[Tuple[str, str, str, float, bool, bool, str]], replay: bool = False) -> Tuple[DataVersion, List[Operation], List[Tuple[str, Operation]]]:
+        """
+        Builds the version following `version` with the operations added (see
+        `addOperations`). Returns it along with the operations created and the
+        (user id, operation) tuples ingested. When the operations are replayed
+        (`replay`) the ones of unknown users or already in the history of their
+        user are skipped instead of raising an error.
+        """
+        histories: Dict[Tuple[int, int], HistoryContainer] = {}
+        added_operations: Dict[int, List[Tuple[str, int, Operation]]] = {}
+        result: List[Operation] = []
+        ingested: List[Tuple[str, Operation]] = []
+        for user_id, id, name, price, added, purchased, removed_id in operations:
+            shard_index = shardOf(str(user_id), len(version.Shards))
+            shard = version.Shards[shard_index]
+            index = shard.UsersIndex.get(str(user_id))
+            if index is None:
+                if replay:
+                    continue
+                raise ValueError("No such user exists: " + str(user_id))
+            if (shard_index, index) not in histories:
+                histories[(shard_index, index)] = shard.UsersData[index].history().copy()
+            operation = Operation(id, name, price, added, purchased, removed_id)
+            try:
+                histories[(shard_index, index)].add(operation)
+            except ValueError:
+                if not replay:
+                    raise
+                continue
+            added_operations.setdefault(shard_index, []).append((str(user_id), index, operation))
+            result.append(operation)
+            ingested.append((str(user_id), operation))
+        shards = list(version.Shards)
+        for shard_index, shard_operations in added_operations.items():
+            shard = shards[shard_index]
+            users_data = list(shard.UsersData)
+            for (history_shard_index, index), history in histories.items():
+                if history_shard_index == shard_index:
+                    user_data = users_data[index].withHistory(history)
+                    version.HistoryCache.replace(users_data[index], user_data)
+                    users_data[index] = user_data
+            bitmap_index = shard.BitmapIndex.copy()
+            bitmap_index.extend([operation for _, _, operation in shard_operations], [index for _, index, _ in shard_operations])
+            sketch_index = shard.SketchIndex.copy()
+            price_index = shard.PriceIndex.copy()
+            for user_id, _, operation in shard_operations:
+                sketch_index.add(user_id, operation)
+                price_index.add(operation)
+            shards[shard_index] = DataShard(tuple(users_data), shard.UsersIndex, bitmap_index, sketch_index, price_index)
+        return DataVersion(version.Number + 1, tuple(shards), version.HistoryCache), result, ingested
+
+    def _cooccurrenceIndex(self, **kwargs) -> CooccurrenceIndex:
+        """
+        Returns the co-occurrence counts for the filters, building them if needed.
+        The counts are updated as operations are ingested, so they must be read
+        holding the write lock.
+
+        Note
+        ----
+
+        The counts are built over the current version without holding the write
+        lock (writes go on meanwhile). The lock is then only taken to add the
+        operations ingested since that version and to register the counts. If
+        the data was reloaded in between they are built again.
+
+        Only the `_cooccurrence_limit` most recently used sets of filters are kept
+        (each keeps the basket of every user).
+        """
+        filters = self._filters(**kwargs)
+        if filters[USERID]:
+            raise ValueError("Associations are computed over all users, they can not be limited by user id.")
+        key = (filters[PURCHASED], filters[ADDED], filters[ABOVE], filters[BELOW])
+        while True:
+            with self._write_lock:
+                if key in self._cooccurrence_indexes:
+                    self._cooccurrence_indexes.move_to_end(key)
+                    return self._cooccurrence_indexes[key]
+                version = self._version
+                loads = self._loads
+            cooccurrence_index = self._buildCooccurrenceIndex(version, filters, kwargs.get(PARALLEL))
+            with self._write_lock:
+                if key in self._cooccurrence_indexes:
+                    self._cooccurrence_indexes.move_to_end(key)
+                    return self._cooccurrence_indexes[key]
+                if self._loads != loads:
+                    continue
+                for built, shard in zip(version.Shards, self._version.Shards):
+                    # NOTE: operations are numbered in the order they were added, so the
+                    #       operations numbered after the version are the last ones of
+                    #       the history of their user.
+                    users = shard.BitmapIndex.columns()[USER]
+                    added: Dict[int, int] = {}
+                    for number in range(built.BitmapIndex.size(), shard.BitmapIndex.size()):
+                        added[users[number]] = added.get(users[number], 0) + 1
+                    del users
+                    for user, count in added.items():
+                        user_data = shard.UsersData[user]
+                        for operation in list(user_data.history())[-count:]:
+                            cooccurrence_index.add(user_data.id(), operation)
+                self._cooccurrence_indexes[key] = cooccurrence_index
+                while len(self._cooccurrence_indexes) > self._cooccurrence_limit:
+                    self._cooccurrence_indexes.popitem(last=False)
+                return cooccurrence_index
+
+    def _buildCooccurrenceIndex(self, version: DataVersion, filters: Dict[str, Any], parallel: bool) -> CooccurrenceIndex:
+        """
+        Returns the co-occurrence counts of a version for the filters (with
+        `parallel` one worker process per shard).
+        """
+        codes: Dict[str, int] = {}
+        users: List[array] = []
+        products: List[array] = []
+        for shard in version.Shards:
+            # NOTE: product codes are made global (the same in every shard)
+            #       before counting, so the counts of the shards can be added.
+            remap = [codes.setdefault(name, len(codes)) for name in shard.BitmapIndex.productNames()]
+            columns = shard.BitmapIndex.columns()
+            numbers = shard.BitmapIndex.select(purchased=filters[PURCHASED], added=filters[ADDED], above=filters[ABOVE], below=filters[BELOW], product_name=None)
+            users.append(array("i", (columns[USER][number] for number in numbers)))
+            products.append(array("i", (remap[columns[PRODUCT][number]] for number in numbers)))
+            del columns
+        if parallel and len(version.Shards) > 1:
+            with ProcessPoolExecutor(max_workers=min(len(version.Shards), os.cpu_count() or 1)) as executor:
+                counts = list(executor.map(countBaskets, users, products))
+        else:
+            counts = [countBaskets(shard_users, shard_products) for shard_users, shard_products in zip(users, products)]
+        cooccurrence_index = CooccurrenceIndex(filters, codes)
+        for shard, (masks, items, pairs) in zip(version.Shards, counts):
+            cooccurrence_index.merge([user_data.id() for user_data in shard.UsersData], masks, items, pairs)
+        return cooccurrence_index
+
+    def _priceScopes(self, **kwargs) -> Tuple[List[SortedPrices], float, float]:
+        """
+        Returns the sorted prices of the operations matching the flags, product
+        and user filters, along with the price band (`above` and `below`, `None`
+        when not given).
+
+        Note
+        ----
+
+        Prices are kept sorted per flags and product in the `PriceIndex` of each
+        shard. A single user has few operations, so the prices of its history are
+        sorted when asked for instead.
+        """
+        filters = self._filters(**kwargs)
+        above = filters[ABOVE] if filters[ABOVE] else None
+        below = filters[BELOW] if filters[BELOW] else None
+        if filters[USERID]:
+            user_data = self._id(filters[USERID])
+            history = user_data.history() if user_data else []
+            prices = [operation.Price for operation in history if operation.matches(purchased=filters[PURCHASED], added=filters[ADDED], above=None, below=None, product_name=filters[PRODUCTNAME])]
+            return [SortedPrices(prices)], above, below
+        return [shard.PriceIndex.prices(filters[PURCHASED], filters[ADDED], filters[PRODUCTNAME]) for shard in self._version.Shards], above, below
+
+    def _materializedView(self, name: str) -> MaterializedView:
+        """
+        Returns the materialized view with the provided name.
+        """
+        view = self._views.get(name)
+        if view is None:
+            raise ValueError("No such view exists: " + str(name))
+        return view
+
+    def _filters(self, **kwargs) -> Dict[str, Any]:
+        """
+        Normalizes the keywords given to `query` (and similar methods) into the
+        filters given to `_query`.
         """
-        # print(kwargs)
         added = True
         purchased = False
         above = None
@@ -106,47 +654,145 @@ class DataManager(metaclass=SingletonMetaClass):
             above = kwargs[ABOVE]
         if BELOW in kwargs.keys():
             below = kwargs[BELOW]
-        if USERID in kwargs.keys():
+        if USERID in kwargs.keys() and kwargs[USERID] is not None:
             user_id = str(kwargs[USERID])
         if PRODUCTNAME in kwargs.keys():
             product_name = kwargs[PRODUCTNAME]
-        return self._query(purchased=purchased, added=added, above=above, below=below, user_id=user_id, product_name=product_name)
+        return {PURCHASED: purchased, ADDED: added, ABOVE: above, BELOW: below, USERID: user_id, PRODUCTNAME: product_name}
 
     def _query(self, purchased: bool, added: bool, above: int, below: int, user_id: str, product_name: str) -> Dict[str, int]:
         """
         Returns a dictionary with the query made for the `purchase` and
         `added` flags for all users.
         """
-        dictionary: Dict[str, int] = {}
-        for user_data in self._users_data:
-            if user_id and user_data.id() != user_id:
-                continue
-            query_data = user_data.query(purchased=purchased, added=added, above=above, below=below, product_name=product_name)
-            for key in query_data.keys():
-                if key in dictionary.keys():
-                    dictionary[key] = dictionary[key] + query_data[key]
-                else:
-                    dictionary[key] = query_data[key]
-        return dictionary
-                
+        return self._explain(purchased=purchased, added=added, above=above, below=below, user_id=user_id, product_name=product_name)[RESULT]
+
+    def _explain(self, purchased: bool, added: bool, above: int, below: int, user_id: str, product_name: str) -> Dict[str, Any]:
+        """
+        Plans and runs a query, returning the plan along with the result.
+
+        Note
+        ----
+
+        A query by user id only goes to the shard owning the user. Any other
+        query is planned and run on every shard and the results are merged (the
+        plan of each shard is then listed under `shards`).
+        """
+        version = self._version
+        shards = [version.shard(user_id)] if user_id else version.Shards
+        explanations = [self._explainShard(shard, purchased, added, above, below, user_id, product_name) for shard in shards]
+        if len(explanations) == 1:
+            return explanations[0]
+        result: Dict[str, int] = {}
+        for explanation in explanations:
+            for key, value in explanation[RESULT].items():
+                result[key] = result.get(key, 0) + value
+        plans = set(explanation[PLAN] for explanation in explanations)
+        return {
+            PLAN: plans.pop() if len(plans) == 1 else "mixed",
+            ESTIMATEDROWS: sum(explanation[ESTIMATEDROWS] for explanation in explanations),
+            ACTUALROWS: sum(explanation[ACTUALROWS] for explanation in explanations),
+            SHARDS: [{key: value for key, value in explanation.items() if key != RESULT} for explanation in explanations],
+            RESULT: result,
+        }
+
+    def _explainShard(self, shard: DataShard, purchased: bool, added: bool, above: int, below: int, user_id: str, product_name: str) -> Dict[str, Any]:
+        """
+        Plans and runs a query on a single shard, returning the plan along with the result.
+        """
+        index = shard.UsersIndex.get(user_id) if user_id else None
+        user_data = shard.UsersData[index] if index is not None else None
+        user_history_size = len(user_data.history()) if user_data else 0
+        filters = {PURCHASED: purchased, ADDED: added, ABOVE: above, BELOW: below, PRODUCTNAME: product_name}
+        plan, candidates = self._planner.plan(shard.BitmapIndex, user_history_size, user_id=user_id, **filters)
+        if plan == ID_LOOKUP:
+            result = user_data.query(**filters) if user_data else {}
+            scanned = user_history_size
+        elif plan == PRODUCT_PARTITION:
+            result, scanned = shard.BitmapIndex.queryProduct(**filters)
+        elif plan == PRICE_INDEX:
+            result, scanned = shard.BitmapIndex.queryPrice(**filters)
+        elif plan == BITMAP_SCAN:
+            result, scanned = shard.BitmapIndex.queryBitmaps(**filters)
+        else:
+            result = {}
+            scanned = 0
+            for user_data in shard.UsersData:
+                if user_id and user_data.id() != user_id:
+                    continue
+                history = user_data.history()
+                scanned += len(history)
+                for key, value in history.query(**filters).items():
+                    result[key] = result.get(key, 0) + value
+        return {PLAN: plan, ESTIMATEDROWS: candidates[plan]["rows"], ACTUALROWS: scanned, CANDIDATES: candidates, RESULT: result}
 
     def dictionary(self) -> Dict[str, Any]:
         """
         Converts all the information on this class into something that
         can be written into a json file.
+
+        Note
+        ----
+
+        This builds the whole dataset in memory, use `write` or `export` to
+        write it into a file one user at a time instead.
         """
         data_dictionary: Dict[str, Any] = {}
-        for user_data in self._users_data:
+        for user_data in self._version.usersData():
             data_dictionary[user_data.id()] = user_data.dictionary()
         return data_dictionary
 
-    def _id(self, id: str) -> UserData:
+    def write(self, fid: TextIO, indent: int = 4) -> int:
         """
-        Return the UserData respective of the provided id.
+        Writes all users as json into a text file object, one user at a time
+        (compact if `indent` is `None`). Returns the number of users written.
         """
-        for user_data in self._users_data:
-            if user_data.id() == id:
-                return user_data
+        return DataExporter(indent=indent).write(fid, self._version.usersData())
+
+    def export(self, path: str, indent: int = None, compression: str = None, users_per_file: int = None) -> List[str]:
+        """
+        Exports all users as json into a file, one user at a time so memory does
+        not grow with the dataset. The output can be compressed (`gzip` or `zlib`)
+        and split into files of `users_per_file` users. Returns the paths written.
+        """
+        exporter = DataExporter(indent=indent, compression=compression, users_per_file=users_per_file)
+        return exporter.export(path, self._version.usersData())
+
+    def columns(self, **kwargs) -> Dict[str, Any]:
+        """
+        Returns all operations (or, given any of the filters of `query`, the
+        ones matching them) as flat columns: `user`, `operation`, `product`,
+        `price`, `added`, `purchased`, `flags` and `removed`, along with the
+        `user_ids`, `operation_ids` and `product_names` they refer to.
+
+        Note
+        ----
+
+        Columns are buffer objects (`numpy.frombuffer` wraps them without a copy).
+        Without filters and with a single shard most of them are views of the
+        bitmap index storage, see `DataColumns.buildColumns`.
+        """
+        filters = self._filters(**kwargs) if kwargs else None
+        return buildColumns(self._version, filters)
+
+    def exportColumns(self, path: str, compressed: bool = False, **kwargs) -> List[str]:
+        """
+        Writes the `columns` (with the same filters) into a `.npz` archive or,
+        for any other path, a directory of `.npy` files. Returns the paths written.
+        """
+        return writeColumns(path, self.columns(**kwargs), compressed=compressed)
+
+    def _id(self, id: str, version: DataVersion = None) -> UserData:
+        """
+        Return the UserData respective of the provided id (in the current
+        version unless another is given).
+        """
+        if version is None:
+            version = self._version
+        shard = version.shard(id)
+        index = shard.UsersIndex.get(str(id))
+        if index is not None:
+            return shard.UsersData[index]
 
     def _load(self) -> None:
         """
@@ -162,11 +808,61 @@ class DataManager(metaclass=SingletonMetaClass):
            With this abstraction a refactor only needs to modify the 
            `_save` and `_load` methods and the rest will remain functional.
         """
-        with open(self._user_data_file, "r") as fid:
-            self._raw_user_data = json.loads(fid.read())
-        self._users_data.clear()
-        for key, value in self._raw_user_data.items():
-            self._users_data.append(UserData(self, id=key, first_name=value[FIRST_NAME], last_name=value[LAST_NAME], history=value[HISTORY]))
+        # NOTE: operations ingested while the files are read are logged, and
+        #       replayed on the loaded version before it is swapped in.
+        with self._write_lock:
+            self._operations_during_load = []
+        try:
+            self._loadVersion()
+        finally:
+            with self._write_lock:
+                self._operations_during_load = None
+
+    def _loadVersion(self) -> None:
+        """
+        Reads the data files into a new version and swaps it in (see `_load`).
+        """
+        paths = [shardFileName(self._user_data_file, shard, self._shards) for shard in range(self._shards)]
+        # NOTE: the indexes saved by `_save` (next to the manager data file)
+        #       are reused when they match the data.
+        index_paths = [indexFileName(shardFileName(self._manager_data_file, shard, self._shards)) for shard in range(self._shards)]
+        # NOTE: the next version is built aside, readers keep using the
+        #       current one until it is swapped in.
+        if self._shards == 1:
+            loaded_shards = [loadShard(paths[0], index_path=index_paths[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self._shards, os.cpu_count() or 1)) as executor:
+                loaded_shards = list(executor.map(loadShard, paths, range(self._shards), [self._shards] * self._shards, index_paths))
+        shards: List[DataShard] = []
+        for users, bitmap_index, sketch_index, price_index in loaded_shards:
+            users_data = tuple(UserData(self, id=id, first_name=first_name, last_name=last_name, history=history) for id, first_name, last_name, history in users)
+            users_index = {user_data.id(): index for index, user_data in enumerate(users_data)}
+            shards.append(DataShard(users_data, users_index, bitmap_index, sketch_index, price_index))
+        del loaded_shards
+        # NOTE: the history cache only starts once all indexes are built.
+        history_cache = HistoryCache(self._memory_budget, self._manager_data_file)
+        for shard in shards:
+            for user_data in shard.UsersData:
+                history_cache.add(user_data)
+        with self._write_lock:
+            number = self._version.Number + 1 if self._version else 0
+            version = DataVersion(number, tuple(shards), history_cache)
+            if self._operations_during_load:
+                # NOTE: an operation might already be in the files read.
+                version = self._ingest(version, self._operations_during_load, replay=True)[0]
+            self._version = version
+            self._operations_during_load = None
+            self._loads += 1
+            # NOTE: the views are recomputed over the new data and the co-occurrence
+            #       indexes (built over the previous data) are dropped.
+            changes = []
+            for view in self._views.values():
+                view_result = view.reset(self._query(**view.filters()))
+                if view_result is not None:
+                    changes.append((view, view_result))
+            self._cooccurrence_indexes = OrderedDict()
+        for view, view_result in changes:
+            view.notify(view_result, version.Number)
         # NOTE: we need to make sure this information is set on a safe file
         #       otherwise we could be overriding the original input data.
         #       (For this task, however, notice that we will not introduce
@@ -187,10 +883,17 @@ class DataManager(metaclass=SingletonMetaClass):
            With this abstraction a refactor only needs to modify the 
            `_save` and `_load` methods and the rest will remain functional.
         """
-        data_dictionary = self.dictionary()
-        with open(self._manager_data_file, "w") as fid:
-            dump = json.dumps(data_dictionary, indent=4)
-            fid.write(dump)
+        version = self._version
+        exporter = DataExporter(indent=4)
+        for shard_index, shard in enumerate(version.Shards):
+            path = shardFileName(self._manager_data_file, shard_index, len(version.Shards))
+            with open(path, "w") as fid:
+                exporter.write(fid, shard.UsersData)
+            # NOTE: the bitmap index goes into its own file (with a fingerprint
+            #       of the data) so `_load` can reuse it with the user data file.
+            with open(indexFileName(path), "w") as fid:
+                json.dump({FINGERPRINT: fingerprint((user_data.id(), user_data.history()) for user_data in shard.UsersData),
+                           BITMAP_INDEX: shard.BitmapIndex.dictionary()}, fid)
 
     def __str__(self):
         """
@@ -198,4 +901,6 @@ class DataManager(metaclass=SingletonMetaClass):
         class will return the json string of all information on class. The
         same for `str` conversions.
         """
-        return json.dumps(self.dictionary(), indent=4)
+        fid = io.StringIO()
+        self.write(fid)
+        return fid.getvalue()
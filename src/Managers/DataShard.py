@@ -0,0 +1,148 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+# Generic libraries
+from typing import Dict, Tuple, List, Iterable
+import hashlib
+import json
+import os
+
+# Local libraries
+from .CommonVariables import *
+from .UserData import UserData
+from .HistoryContainer import HistoryContainer
+from .BitmapIndex import BitmapIndex
+from .Sketches import SketchIndex
+from .PriceIndex import PriceIndex
+
+
+def shardOf(id: str, shards: int) -> int:
+    """
+    Returns the shard owning the user. User ids are sha224 hex digests so the
+    id itself is used as the hash (any other id is hashed with sha224 first).
+    """
+    if shards == 1:
+        return 0
+    try:
+        value = int(id, 16)
+    except ValueError:
+        value = int(hashlib.sha224(id.encode("utf-8")).hexdigest(), 16)
+    return value % shards
+
+
+def shardFileName(path: str, shard: int, shards: int) -> str:
+    """
+    Returns the name of the file of a shard: `users.json` becomes `users.0-of-4.json`
+    for the first of four shards (and stays the same for a single shard).
+    """
+    if shards == 1:
+        return path
+    root, extension = os.path.splitext(path)
+    return root + "." + str(shard) + "-of-" + str(shards) + extension
+
+
+def indexFileName(path: str) -> str:
+    """
+    Returns the name of the file in which the indexes of a data file are saved:
+    `safe_users.json` becomes `safe_users.index.json`.
+    """
+    root, extension = os.path.splitext(path)
+    return root + ".index" + extension
+
+
+def fingerprint(users: Iterable[Tuple[str, HistoryContainer]]) -> str:
+    """
+    Returns a hash of the operations of the users (ids, names, prices and flags,
+    in order), used to check that a saved index matches the data it is loaded with.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for id, history in users:
+        hasher.update(("U" + id + "\n").encode("utf-8"))
+        for operation in history:
+            hasher.update((operation.Id + "\0" + operation.Name + "\0" + repr(operation.Price) + "\0" + str(int(bool(operation.Added))) + str(int(bool(operation.Purchased))) + "\n").encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def loadShard(path: str, shard: int = 0, shards: int = 1, index_path: str = None) -> Tuple[List[Tuple[str, str, str, HistoryContainer]], BitmapIndex, SketchIndex, PriceIndex]:
+    """
+    Loads a shard file, returning its users as (id, first name, last name, history)
+    tuples along with the bitmap, sketch and price indexes of its operations.
+
+    Note
+    ----
+
+    This is a module level function (and returns no `UserData`, which refer to
+    the `DataManager`) so that shards can be loaded in worker processes.
+
+    The bitmap index saved by `DataManager._save` into `index_path` is used when
+    its fingerprint matches the data loaded, otherwise it is rebuilt.
+    """
+    with open(path, "r") as fid:
+        raw_user_data = json.loads(fid.read())
+    users: List[Tuple[str, str, str, HistoryContainer]] = []
+    for key, value in raw_user_data.items():
+        if shardOf(key, shards) != shard:
+            raise ValueError("User " + key + " in " + path + " does not belong to shard " + str(shard) + " of " + str(shards) + ".")
+        users.append((key, value[FIRST_NAME], value[LAST_NAME], HistoryContainer(value[HISTORY])))
+    del raw_user_data
+    bitmap_index = None
+    if index_path and os.path.exists(index_path):
+        with open(index_path, "r") as fid:
+            raw_index = json.loads(fid.read())
+        if raw_index.get(FINGERPRINT) == fingerprint((id, history) for id, _, _, history in users):
+            bitmap_index = BitmapIndex(raw_index[BITMAP_INDEX])
+        del raw_index
+    sketch_index = SketchIndex()
+    operations = []
+    operations_users = []
+    for index, (id, _, _, history) in enumerate(users):
+        for operation in history:
+            operations.append(operation)
+            operations_users.append(index)
+            sketch_index.add(id, operation)
+    if bitmap_index is None:
+        bitmap_index = BitmapIndex()
+        bitmap_index.extend(operations, operations_users)
+    price_index = PriceIndex(operations)
+    return users, bitmap_index, sketch_index, price_index
+
+
+class DataShard:
+    """
+    A `DataShard` holds the users of one shard of the dataset (the ones whose
+    id hashes to it, see `shardOf`) along with the indexes of their operations.
+    Like the `DataVersion` that contains it, it is never modified once built.
+    """
+    UsersData: Tuple[UserData, ...] = None
+    UsersIndex: Dict[str, int] = None
+    BitmapIndex: BitmapIndex = None
+    SketchIndex: SketchIndex = None
+    PriceIndex: PriceIndex = None
+    def __init__(self, users_data: Tuple[UserData, ...], users_index: Dict[str, int], bitmap_index: BitmapIndex, sketch_index: SketchIndex, price_index: PriceIndex) -> None:
+        self.UsersData = users_data
+        self.UsersIndex = users_index
+        self.BitmapIndex = bitmap_index
+        self.SketchIndex = sketch_index
+        self.PriceIndex = price_index
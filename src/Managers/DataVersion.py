@@ -0,0 +1,64 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+# Generic libraries
+from typing import Tuple, Iterator
+
+# Local libraries
+from .UserData import UserData
+from .HistoryCache import HistoryCache
+from .DataShard import DataShard, shardOf
+
+
+class DataVersion:
+    """
+    A `DataVersion` is an immutable snapshot of everything the `DataManager`
+    reads from: the shards (users, id index and query indexes of each) and the
+    history cache.
+
+    Readers take the current version once and use only it, so they never see
+    a half applied change. Writers build the next version (copying only what
+    changes) and swap it in with a single assignment.
+    """
+    Number: int = None
+    Shards: Tuple[DataShard, ...] = None
+    HistoryCache: HistoryCache = None
+    def __init__(self, number: int, shards: Tuple[DataShard, ...], history_cache: HistoryCache) -> None:
+        self.Number = number
+        self.Shards = shards
+        self.HistoryCache = history_cache
+
+    def shard(self, id: str) -> DataShard:
+        """
+        Returns the shard owning the user with the provided id.
+        """
+        return self.Shards[shardOf(str(id), len(self.Shards))]
+
+    def usersData(self) -> Iterator[UserData]:
+        """
+        Iterates over the users of all shards.
+        """
+        for shard in self.Shards:
+            yield from shard.UsersData
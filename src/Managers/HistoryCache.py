@@ -0,0 +1,241 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+# Generic libraries
+from typing import Dict, Tuple, Any
+from collections import OrderedDict
+import threading
+import tempfile
+import weakref
+import json
+import os
+
+# Utilities libraries
+from src.Utils import deepsizeof
+
+# Local libraries
+from .HistoryContainer import HistoryContainer
+
+
+class SpillFile:
+    """
+    The `SpillFile` is a page indexed store for histories evicted from memory.
+    Each history is written as json into one or more consecutive pages and the
+    index keeps, per key, the first page and the length of the record.
+
+    Note
+    ----
+
+    A history written again that still fits in its pages is overwritten in
+    place, otherwise it is appended at the end of the file (the old pages are
+    left unused). The file is temporary: it is created next to `path` and
+    removed once the `SpillFile` is garbage collected.
+    """
+    _path: str = None
+    _page_size: int = None
+    _pages: int = None
+    _index: Dict[int, Tuple[int, int, int]] = None
+    def __init__(self, path: str, page_size: int = 4096) -> None:
+        directory, name = os.path.split(os.path.abspath(path))
+        descriptor, self._path = tempfile.mkstemp(prefix=name + ".", suffix=".spill", dir=directory)
+        os.close(descriptor)
+        weakref.finalize(self, os.remove, self._path)
+        self._page_size = page_size
+        self._pages = 0
+        self._index = {}
+
+    def contains(self, key: int) -> bool:
+        """
+        Returns `True` if a history was written into the file with this key.
+        """
+        return key in self._index
+
+    def write(self, key: int, history: HistoryContainer) -> None:
+        """
+        Writes the history into the file.
+        """
+        record = json.dumps(history.dictionary()).encode("utf-8")
+        pages = max(1, -(-len(record) // self._page_size))
+        if key in self._index and pages <= self._index[key][1]:
+            first_page = self._index[key][0]
+            pages = self._index[key][1]
+        else:
+            first_page = self._pages
+            self._pages += pages
+        with open(self._path, "r+b") as fid:
+            fid.seek(first_page * self._page_size)
+            fid.write(record)
+        self._index[key] = (first_page, pages, len(record))
+
+    def read(self, key: int) -> HistoryContainer:
+        """
+        Reads a history from the file.
+        """
+        first_page, _, length = self._index[key]
+        with open(self._path, "rb") as fid:
+            fid.seek(first_page * self._page_size)
+            return HistoryContainer(json.loads(fid.read(length).decode("utf-8")))
+
+    def size(self) -> int:
+        """
+        Returns the size of the file in bytes.
+        """
+        return os.path.getsize(self._path)
+
+
+class HistoryCache:
+    """
+    The `HistoryCache` keeps the `HistoryContainer` of each user in memory
+    within a memory budget (in bytes). When the budget is exceeded the least
+    recently used histories are evicted to a `SpillFile` and transparently
+    reloaded the next time they are accessed.
+
+    Without a budget nothing is ever evicted (and no statistics are kept).
+
+    Note
+    ----
+
+    The cache is shared by the threads reading the data so every change to it
+    is done under a lock. A `UserData` replaced by a newer version (see
+    `replace`) is no longer evicted, so readers still holding the old version
+    keep seeing its history.
+    """
+    _budget: int = None
+    _spill_file_path: str = None
+    _spill_file: SpillFile = None
+    _lock: threading.Lock = None
+    _keys: "weakref.WeakKeyDictionary" = None
+    _next_key: int = None
+    _resident: "OrderedDict[Any, int]" = None
+    _resident_bytes: int = None
+    _modified: set = None
+    _hits: int = None
+    _misses: int = None
+    _evictions: int = None
+    def __init__(self, budget: int = None, spill_file: str = None) -> None:
+        self._budget = budget
+        self._spill_file_path = spill_file
+        self._lock = threading.Lock()
+        self._keys = weakref.WeakKeyDictionary()
+        self._next_key = 0
+        self._resident = OrderedDict()
+        self._resident_bytes = 0
+        self._modified = set()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def add(self, user_data) -> None:
+        """
+        Registers a (resident) user history in the cache without counting an access.
+        """
+        if self._budget is None:
+            return
+        with self._lock:
+            user_data._history_cache = self
+            self._insert(user_data)
+            self._evict(keep=None)
+
+    def access(self, user_data) -> HistoryContainer:
+        """
+        Marks the history of the user as used and returns it, reloading it
+        from the spill file if it was evicted.
+        """
+        with self._lock:
+            if user_data in self._resident:
+                self._hits += 1
+                self._resident.move_to_end(user_data)
+                return user_data._history
+            if user_data._history is not None:
+                return user_data._history
+            self._misses += 1
+            user_data._history = self._spill_file.read(self._keys[user_data])
+            self._insert(user_data)
+            self._evict(keep=user_data)
+            return user_data._history
+
+    def replace(self, old_user_data, new_user_data) -> None:
+        """
+        Replaces the `UserData` of an user by its newer version (with a
+        modified history).
+        """
+        if self._budget is None:
+            return
+        with self._lock:
+            if old_user_data in self._resident:
+                self._resident_bytes -= self._resident.pop(old_user_data)
+                self._modified.discard(old_user_data)
+            new_user_data._history_cache = self
+            self._insert(new_user_data)
+            self._evict(keep=new_user_data)
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        Returns the LRU statistics (useful to choose the memory budget).
+        """
+        with self._lock:
+            accesses = self._hits + self._misses
+            return {
+                "budget": self._budget,
+                "resident": len(self._resident),
+                "resident_bytes": self._resident_bytes,
+                "spill_file_bytes": self._spill_file.size() if self._spill_file else 0,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / accesses if accesses else None,
+                "evictions": self._evictions,
+            }
+
+    def _insert(self, user_data) -> None:
+        """
+        Adds a resident history to the most recently used end of the cache.
+        """
+        if user_data not in self._keys:
+            self._keys[user_data] = self._next_key
+            self._next_key += 1
+            self._modified.add(user_data)
+        size = deepsizeof(user_data._history)
+        self._resident[user_data] = size
+        self._resident_bytes += size
+
+    def _evict(self, keep) -> None:
+        """
+        Evicts the least recently used histories until the budget is respected
+        (`keep` is never evicted).
+        """
+        while self._resident_bytes > self._budget and len(self._resident) > 0:
+            user_data, size = next(iter(self._resident.items()))
+            if user_data is keep:
+                break
+            if self._spill_file is None:
+                self._spill_file = SpillFile(self._spill_file_path)
+            # NOTE: histories reloaded and not modified since are already on disk.
+            if user_data in self._modified:
+                self._spill_file.write(self._keys[user_data], user_data._history)
+                self._modified.discard(user_data)
+            user_data._history = None
+            del self._resident[user_data]
+            self._resident_bytes -= size
+            self._evictions += 1
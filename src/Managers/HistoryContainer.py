@@ -46,6 +46,21 @@ class Operation:
         self.Purchased = purchased
         self.RemovedId = removed_id
 
+    def matches(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> bool:
+        """
+        Returns `True` if the operation matches the filters (same conditions as
+        `HistoryContainer.query`).
+        """
+        if self.Added != added or self.Purchased != purchased:
+            return False
+        if product_name and self.Name != product_name:
+            return False
+        if above and self.Price < above:
+            return False
+        if below and self.Price > below:
+            return False
+        return True
+
 
 class HistoryContainer:
     """
@@ -65,6 +80,23 @@ class HistoryContainer:
             dictionary[operation.Id] = (operation.Name, operation.Price, operation.Added, operation.Purchased, operation.RemovedId)
         return dictionary
 
+    def copy(self) -> "HistoryContainer":
+        """
+        Returns a copy of this container (the operations themselves are shared).
+        """
+        history = HistoryContainer({})
+        history._history = list(self._history)
+        return history
+
+    def add(self, operation: Operation) -> None:
+        """
+        Appends a new operation to the end of the history.
+        """
+        for existing in self._history:
+            if existing.Id == operation.Id:
+                raise ValueError("An operation with id " + operation.Id + " already exists.")
+        self._history.append(operation)
+
     def query(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> Dict[str, int]:
         """
         Returns a dictionary with the query made for the `purchase` and
@@ -72,19 +104,26 @@ class HistoryContainer:
         """
         dictionary: Dict[str, int] = {}
         for operation in self._history:
-            if operation.Added == added and operation.Purchased == purchased:
-                if product_name and operation.Name != product_name:
-                    continue
-                if above and operation.Price < above:
-                    continue
-                if below and operation.Price > below:
-                    continue
+            if operation.matches(purchased, added, above, below, product_name):
                 if operation.Name in dictionary.keys():
                     dictionary[operation.Name] = dictionary[operation.Name] + 1
                 else:
                     dictionary[operation.Name] = 1
         return dictionary
 
+    def aggregate(self, purchased: bool, added: bool, above: int, below: int, product_name: str) -> Tuple[int, float]:
+        """
+        Returns the number of operations matching the `purchase` and `added`
+        flags (same filters as `query`) and the sum of their prices.
+        """
+        count = 0
+        spend = 0
+        for operation in self._history:
+            if operation.matches(purchased, added, above, below, product_name):
+                count += 1
+                spend += operation.Price
+        return count, spend
+
     def _buildHistoryFromDictionary(self, history: Dict[str, Tuple[str, float, bool, bool, str]]) -> None:
         """
         Generic parser to easilly convert between a dictionary (coming from a json file)
@@ -103,6 +142,12 @@ class HistoryContainer:
                 removed_id = history[key][4]
             self._history.append(Operation(id, name, price, added, purchased, removed_id))
 
+    def __len__(self) -> int:
+        """
+        Returns the number of operations.
+        """
+        return len(self._history)
+
     def __iter__(self):
         """
         Iterating over this object returns the operations.
@@ -0,0 +1,171 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+
+# Generic libraries
+from typing import Dict, Tuple, Iterable, Callable, AsyncIterator, Any
+import threading
+import asyncio
+
+# Local libraries
+from .CommonVariables import *
+from .HistoryContainer import Operation
+
+
+class MaterializedView:
+    """
+    A `MaterializedView` keeps the result of a standing query (with the filters
+    of `DataManager.query`) up to date as operations are ingested, so reading it
+    only costs a copy of the result.
+
+    Subscribers are notified every time the result changes, either through a
+    callback (`subscribe`) or an async iterator (`watch`).
+
+    Note
+    ----
+
+    The result is never modified in place: each update builds a new dictionary
+    and swaps it in, so it can be read from any thread without locking (same as
+    the `DataVersion`). Updates themselves are serialized by the `DataManager`.
+
+    Subscribers are notified outside the lock of the manager, so concurrent
+    writers might notify out of order. Each result is given with the number of
+    the version it comes from and a result older than the last one notified is
+    dropped, so subscribers always end on the latest result.
+    """
+    Name: str = None
+    _filters: Dict[str, Any] = None
+    _result: Dict[str, int] = None
+    _callbacks: Tuple[Callable[[str, Dict[str, int]], None], ...] = None
+    _lock: threading.Lock = None
+    _notify_lock: threading.RLock = None
+    _notified: int = None
+    def __init__(self, name: str, filters: Dict[str, Any], result: Dict[str, int], number: int, lock: threading.Lock) -> None:
+        self.Name = name
+        self._filters = dict(filters)
+        self._result = dict(result)
+        self._callbacks = ()
+        self._lock = lock
+        self._notify_lock = threading.RLock()
+        self._notified = number
+
+    def filters(self) -> Dict[str, Any]:
+        """
+        Returns the filters of the view (as given to `DataManager._query`).
+        """
+        return dict(self._filters)
+
+    def result(self) -> Dict[str, int]:
+        """
+        Returns the current result of the view.
+        """
+        return dict(self._result)
+
+    def apply(self, operations: Iterable[Tuple[str, Operation]]) -> Dict[str, int]:
+        """
+        Updates the result with new operations, given as (user id, operation)
+        tuples. Returns the new result, or `None` if none of the operations
+        matched the filters (the result did not change).
+        """
+        result = None
+        for user_id, operation in operations:
+            if not self._matches(user_id, operation):
+                continue
+            if result is None:
+                result = dict(self._result)
+            result[operation.Name] = result.get(operation.Name, 0) + 1
+        if result is not None:
+            self._result = result
+        return result
+
+    def reset(self, result: Dict[str, int]) -> Dict[str, int]:
+        """
+        Replaces the result with one computed from scratch (when the data is
+        reloaded). Returns the new result, or `None` if it did not change.
+        """
+        if result == self._result:
+            return None
+        self._result = dict(result)
+        return self._result
+
+    def subscribe(self, callback: Callable[[str, Dict[str, int]], None]) -> None:
+        """
+        Registers a callback, called with the name of the view and its new result
+        every time it changes (in the thread that ingested the operations).
+        """
+        with self._lock:
+            self._callbacks = self._callbacks + (callback,)
+
+    def unsubscribe(self, callback: Callable[[str, Dict[str, int]], None]) -> None:
+        """
+        Removes a callback registered with `subscribe`.
+        """
+        with self._lock:
+            self._callbacks = tuple(existing for existing in self._callbacks if existing is not callback)
+
+    def notify(self, result: Dict[str, int], number: int) -> None:
+        """
+        Calls every subscriber with a (copy of the) new result, computed over
+        the version with the given `number`, unless a result of a later version
+        was already notified.
+        """
+        with self._notify_lock:
+            if number <= self._notified:
+                return
+            self._notified = number
+            for callback in self._callbacks:
+                callback(self.Name, dict(result))
+
+    async def watch(self) -> AsyncIterator[Dict[str, int]]:
+        """
+        Yields the result of the view every time it changes (starting with the
+        current one). Changes made from other threads are handed over to the
+        event loop running the iterator.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        def callback(name: str, result: Dict[str, int]) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, result)
+            except RuntimeError:
+                # NOTE: the event loop was closed without closing the iterator.
+                self.unsubscribe(callback)
+        self.subscribe(callback)
+        try:
+            yield self.result()
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(callback)
+
+    def _matches(self, user_id: str, operation: Operation) -> bool:
+        """
+        Returns `True` if the operation (of the user) matches the filters of the
+        view.
+        """
+        filters = self._filters
+        if filters[USERID] and user_id != filters[USERID]:
+            return False
+        return operation.matches(purchased=filters[PURCHASED], added=filters[ADDED], above=filters[ABOVE], below=filters[BELOW], product_name=filters[PRODUCTNAME])
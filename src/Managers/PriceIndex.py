@@ -0,0 +1,211 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+
+# Generic libraries
+from typing import Dict, Tuple, List, Iterable, Sequence
+from itertools import accumulate
+from array import array
+import bisect
+import math
+
+# Local libraries
+from .HistoryContainer import Operation
+
+
+class SortedPrices:
+    """
+    The `SortedPrices` keeps a set of prices sorted along with their prefix sums,
+    so the number of prices in a band, their sum and any quantile are found with
+    binary searches (O(log n)) instead of a scan.
+
+    Note
+    ----
+
+    Inserting into a sorted array moves (and re-sums) everything after the new
+    price. Instead new prices go into a small sorted `_pending` list (with its
+    own prefix sums) that is merged into the arrays once it grows past the
+    square root of their size, and queries search both. The arrays are never modified once built, so they
+    are shared between copies (only `_pending` is copied).
+    """
+    _prices: array = None
+    _sums: array = None
+    _pending: List[float] = None
+    _pending_sums: List[float] = None
+    def __init__(self, prices: Iterable[float] = ()) -> None:
+        self._pending = []
+        self._pending_sums = [0.0]
+        self._build(sorted(prices))
+
+    def copy(self) -> "SortedPrices":
+        """
+        Returns a copy that can be added to without modifying this one.
+        """
+        sorted_prices = SortedPrices()
+        sorted_prices._prices = self._prices
+        sorted_prices._sums = self._sums
+        sorted_prices._pending = list(self._pending)
+        sorted_prices._pending_sums = list(self._pending_sums)
+        return sorted_prices
+
+    def add(self, price: float) -> None:
+        """
+        Adds a price.
+        """
+        position = bisect.bisect_right(self._pending, price)
+        self._pending.insert(position, price)
+        self._pending_sums[position:] = accumulate(self._pending[position:], initial=self._pending_sums[position])
+        if len(self._pending) > max(32, math.isqrt(len(self._prices))):
+            self._build(sorted(list(self._prices) + self._pending))
+            self._pending = []
+            self._pending_sums = [0.0]
+
+    def size(self) -> int:
+        """
+        Returns the number of prices.
+        """
+        return len(self._prices) + len(self._pending)
+
+    def cumulative(self, price: float, inclusive: bool = False) -> Tuple[int, float]:
+        """
+        Returns the number and the sum of the prices below `price` (or equal to
+        it if `inclusive`), of all prices if `price` is `None`.
+        """
+        if price is None:
+            return self.size(), self._sums[-1] + self._pending_sums[-1]
+        search = bisect.bisect_right if inclusive else bisect.bisect_left
+        position = search(self._prices, price)
+        pending_position = search(self._pending, price)
+        return position + pending_position, self._sums[position] + self._pending_sums[pending_position]
+
+    def sequences(self, above: float, below: float) -> List[Tuple[Sequence[float], int, int]]:
+        """
+        Returns the sorted sequences of prices (the arrays and the pending prices)
+        along with the positions of the band (not below `above` and not above
+        `below`, either can be `None`) in each, see `kth`.
+        """
+        sequences = []
+        for prices in (self._prices, self._pending):
+            first = bisect.bisect_left(prices, above) if above is not None else 0
+            last = bisect.bisect_right(prices, below) if below is not None else len(prices)
+            sequences.append((prices, first, max(first, last)))
+        return sequences
+
+    def _build(self, prices: List[float]) -> None:
+        """
+        Replaces the arrays with (already sorted) prices and their prefix sums.
+        """
+        self._prices = array("d", prices)
+        self._sums = array("d", accumulate(prices, initial=0.0))
+
+
+def priceBand(scopes: Iterable[SortedPrices], above: float, below: float, inclusive: bool = True) -> Tuple[int, float]:
+    """
+    Returns the number and the sum of the prices of several `SortedPrices` that
+    are not below `above` and are below `below` (or equal to it if `inclusive`).
+    Either bound can be `None`.
+    """
+    count = 0
+    total = 0.0
+    for sorted_prices in scopes:
+        last_count, last_total = sorted_prices.cumulative(below, inclusive)
+        first_count, first_total = sorted_prices.cumulative(above) if above is not None else (0, 0.0)
+        if last_count > first_count:
+            count += last_count - first_count
+            total += last_total - first_total
+    return count, total
+
+
+def kth(sequences: List[Tuple[Sequence[float], int, int]], k: int) -> float:
+    """
+    Returns the k-th (starting at 0) smallest value within the ranges of several
+    sorted sequences, given as (sequence, first, last) tuples.
+
+    Note
+    ----
+
+    The value is searched with a binary search inside each range in turn, ranking
+    each candidate with a binary search in every range, so it takes
+    O((number of ranges * log n)^2) instead of merging the sequences.
+    """
+    for values, first, last in sequences:
+        while first < last:
+            middle = (first + last) // 2
+            value = values[middle]
+            if sum(bisect.bisect_left(other, value, start, end) - start for other, start, end in sequences) > k:
+                last = middle
+            elif sum(bisect.bisect_right(other, value, start, end) - start for other, start, end in sequences) > k:
+                return value
+            else:
+                first = middle + 1
+    raise IndexError("There are not " + str(k + 1) + " values in the ranges.")
+
+
+class PriceIndex:
+    """
+    The `PriceIndex` keeps the prices of the operations sorted (see `SortedPrices`)
+    per flags (`(added, purchased)` tuples, as in `BitmapIndex.statistics`) and per
+    flags and product name, for price histograms, quantiles and revenue.
+    """
+    _scopes: Dict[Tuple[Tuple[bool, bool], str], SortedPrices] = None
+    def __init__(self, operations: Iterable[Operation] = ()) -> None:
+        prices: Dict[Tuple[Tuple[bool, bool], str], List[float]] = {}
+        for operation in operations:
+            for key in self._keys(operation):
+                prices.setdefault(key, []).append(operation.Price)
+        self._scopes = {key: SortedPrices(values) for key, values in prices.items()}
+
+    def copy(self) -> "PriceIndex":
+        """
+        Returns a copy of this index that can be added to without modifying
+        this one (the sorted arrays are shared).
+        """
+        price_index = PriceIndex()
+        price_index._scopes = {key: sorted_prices.copy() for key, sorted_prices in self._scopes.items()}
+        return price_index
+
+    def add(self, operation: Operation) -> None:
+        """
+        Adds the price of an operation to the index.
+        """
+        for key in self._keys(operation):
+            if key not in self._scopes:
+                self._scopes[key] = SortedPrices()
+            self._scopes[key].add(operation.Price)
+
+    def prices(self, purchased: bool, added: bool, product_name: str) -> SortedPrices:
+        """
+        Returns the sorted prices of the operations with the flags (and product
+        name, if given).
+        """
+        return self._scopes.get(((added, purchased), product_name or None), SortedPrices())
+
+    def _keys(self, operation: Operation) -> List[Tuple[Tuple[bool, bool], str]]:
+        """
+        Returns the scopes of an operation (its flags, with and without its
+        product name).
+        """
+        flags = (operation.Added, operation.Purchased)
+        return [(flags, None), (flags, operation.Name)]
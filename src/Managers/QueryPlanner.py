@@ -0,0 +1,123 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+# Generic libraries
+from typing import Dict, Tuple, Any
+
+# Local libraries
+from .CommonVariables import *
+from .BitmapIndex import BitmapIndex
+
+
+class QueryPlanner:
+    """
+    The `QueryPlanner` chooses how the `DataManager` answers a query. For the
+    normalized filters it estimates the number of operations each available
+    access path would scan and picks the cheapest:
+
+     - `id_lookup`: only the history of the user (when `user_id` is given).
+     - `product_partition`: only the operations of the product (when `product_name` is given).
+     - `price_index`: only the operations in the price band, found by binary
+       search over the operations sorted by price (when `above`/`below` are given).
+     - `bitmap_scan`: AND-ing the bitmaps of the `BitmapIndex` (only the operations
+       in price buckets crossing a bound are scanned).
+     - `full_scan`: every operation of every user.
+
+    Note
+    ----
+
+    The estimates come from the statistics of the `BitmapIndex` (operations per
+    product, per flags and the price histogram). The cost of a bitmap scan also
+    accounts for the bitmap words it goes through (`bitmap_word_cost` of an
+    operation scan each, python does them in C).
+    """
+    _bitmap_word_cost: float = None
+    def __init__(self, bitmap_word_cost: float = 1 / 64) -> None:
+        self._bitmap_word_cost = bitmap_word_cost
+
+    def plan(self, bitmap_index: BitmapIndex, user_history_size: int, purchased: bool, added: bool, above: int, below: int, user_id: str, product_name: str) -> Tuple[str, Dict[str, Dict[str, float]]]:
+        """
+        Returns the chosen access path and, per candidate path, its estimated
+        number of operations scanned (`rows`) and its `cost`.
+        """
+        statistics = bitmap_index.statistics()
+        size = statistics["size"]
+        candidates: Dict[str, Dict[str, float]] = {}
+        if user_id:
+            candidates[ID_LOOKUP] = {"rows": user_history_size, "cost": user_history_size}
+            candidates[FULL_SCAN] = {"rows": user_history_size, "cost": size}
+        else:
+            if product_name:
+                rows = statistics["products"].get(product_name, 0)
+                candidates[PRODUCT_PARTITION] = {"rows": rows, "cost": rows}
+            if above or below:
+                rows = self._bandRows(statistics, above, below)
+                candidates[PRICE_INDEX] = {"rows": rows, "cost": rows}
+            rows = self._boundaryRows(statistics, above, below)
+            bitmaps = 2 + (1 if product_name else 0) + len(statistics["products"])
+            if above or below:
+                bitmaps += len(statistics["buckets"])
+            words = bitmaps * (size // 64 + 1)
+            candidates[BITMAP_SCAN] = {"rows": rows, "cost": rows + words * self._bitmap_word_cost}
+            candidates[FULL_SCAN] = {"rows": size, "cost": size}
+        chosen = min(candidates, key=lambda path: candidates[path]["cost"])
+        return chosen, candidates
+
+    def _bandRows(self, statistics: Dict[str, Any], above: int, below: int) -> float:
+        """
+        Estimates the number of operations inside the price band with the price
+        histogram (uniform prices within each bucket).
+        """
+        width = statistics["bucket_width"]
+        rows = 0.0
+        for bucket, count in statistics["buckets"].items():
+            low = bucket * width
+            high = low + width
+            band_low = max(low, above) if above else low
+            band_high = min(high, below) if below else high
+            if band_high > band_low:
+                rows += count * (band_high - band_low) / width
+            elif band_high == band_low and count:
+                rows += count / width
+        return rows
+
+    def _boundaryRows(self, statistics: Dict[str, Any], above: int, below: int) -> int:
+        """
+        Returns the number of operations in the price buckets crossing a bound
+        of the price band (the ones a bitmap scan has to check one by one).
+        """
+        if not above and not below:
+            return 0
+        width = statistics["bucket_width"]
+        rows = 0
+        for bucket, count in statistics["buckets"].items():
+            low = bucket * width
+            high = low + width
+            if (above and high <= above) or (below and low > below):
+                continue
+            if (not above or low >= above) and (not below or high <= below):
+                continue
+            rows += count
+        return rows
@@ -0,0 +1,242 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+# Generic libraries
+from typing import Dict, Tuple, List, Any
+import hashlib
+import math
+
+# Local libraries
+from .HistoryContainer import Operation
+
+
+def hash64(s: str) -> int:
+    """
+    Returns a 64 bit hash of the string (stable between runs, unlike `hash`).
+    """
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class CountMinSketch:
+    """
+    The `CountMinSketch` estimates how many times each key was counted using a
+    fixed amount of memory (`depth` rows of `width` counters). Estimates never
+    go below the real count and, with probability `1 - exp(-depth)`, do not
+    go above it by more than `e / width` times the total count.
+
+    Two sketches with the same `width` and `depth` can be merged by adding
+    their counters.
+    """
+    _width: int = None
+    _depth: int = None
+    _total: int = None
+    _table: List[List[int]] = None
+    def __init__(self, width: int = 272, depth: int = 5) -> None:
+        self._width = width
+        self._depth = depth
+        self._total = 0
+        self._table = [[0] * width for _ in range(depth)]
+
+    def add(self, key: str, count: int = 1) -> None:
+        """
+        Counts the key `count` times.
+        """
+        self._total += count
+        for row, column in enumerate(self._columns(key)):
+            self._table[row][column] += count
+
+    def estimate(self, key: str) -> int:
+        """
+        Returns the estimated count of the key.
+        """
+        return min(self._table[row][column] for row, column in enumerate(self._columns(key)))
+
+    def error(self) -> int:
+        """
+        Returns the upper bound of the overestimation (`e / width` times the total count).
+        """
+        return math.ceil(math.e / self._width * self._total)
+
+    def copy(self) -> "CountMinSketch":
+        """
+        Returns a copy of this sketch.
+        """
+        sketch = CountMinSketch(self._width, self._depth)
+        sketch._total = self._total
+        sketch._table = [list(row) for row in self._table]
+        return sketch
+
+    def merge(self, other: "CountMinSketch") -> None:
+        """
+        Adds the counters of another sketch (with the same dimensions) to this one.
+        """
+        if (self._width, self._depth) != (other._width, other._depth):
+            raise ValueError("Count-min sketches with different dimensions can not be merged.")
+        self._total += other._total
+        for row, other_row in zip(self._table, other._table):
+            for column, count in enumerate(other_row):
+                row[column] += count
+
+    def _columns(self, key: str) -> List[int]:
+        """
+        Returns the column of the key in each row (double hashing from a single hash).
+        """
+        value = hash64(key)
+        first, second = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(first + row * second) % self._width for row in range(self._depth)]
+
+
+class HyperLogLog:
+    """
+    The `HyperLogLog` estimates the number of distinct keys it has seen with
+    `2 ** precision` small registers. The standard error is `1.04 / sqrt(2 ** precision)`
+    (about 3% with the default 1024 registers).
+
+    Two counters with the same precision can be merged by keeping the maximum
+    of each register.
+    """
+    _precision: int = None
+    _registers: bytearray = None
+    def __init__(self, precision: int = 10) -> None:
+        self._precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def add(self, key: str) -> None:
+        """
+        Adds a key to the counter.
+        """
+        value = hash64(key)
+        register = value & ((1 << self._precision) - 1)
+        remaining = value >> self._precision
+        rank = (64 - self._precision) - remaining.bit_length() + 1
+        if rank > self._registers[register]:
+            self._registers[register] = rank
+
+    def estimate(self) -> int:
+        """
+        Returns the estimated number of distinct keys.
+        """
+        m = len(self._registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # NOTE: small range correction (linear counting).
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def error(self) -> int:
+        """
+        Returns the standard error of the current estimate.
+        """
+        return math.ceil(1.04 / math.sqrt(len(self._registers)) * self.estimate())
+
+    def copy(self) -> "HyperLogLog":
+        """
+        Returns a copy of this counter.
+        """
+        counter = HyperLogLog(self._precision)
+        counter._registers = bytearray(self._registers)
+        return counter
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """
+        Merges the registers of another counter (with the same precision) into this one.
+        """
+        if self._precision != other._precision:
+            raise ValueError("HyperLogLog counters with different precisions can not be merged.")
+        self._registers = bytearray(max(a, b) for a, b in zip(self._registers, other._registers))
+
+
+class SketchIndex:
+    """
+    The `SketchIndex` keeps the sketches used by the approximate queries of the
+    `DataManager`: one `CountMinSketch` counting operations per (flags, product)
+    and one `HyperLogLog` counting distinct users per (flags, product).
+
+    Note
+    ----
+
+    The sketches only know the `added`, `purchased` flags and the product name
+    (no prices or users), so only those filters are available in approximate mode.
+    """
+    _counts: CountMinSketch = None
+    _users: Dict[Tuple[bool, bool, str], HyperLogLog] = None
+    def __init__(self) -> None:
+        self._counts = CountMinSketch()
+        self._users = {}
+
+    def add(self, user_id: str, operation: Operation) -> None:
+        """
+        Adds an operation performed by the user to the sketches.
+        """
+        key = (operation.Added, operation.Purchased, operation.Name)
+        self._counts.add(self._key(*key))
+        if key not in self._users:
+            self._users[key] = HyperLogLog()
+        self._users[key].add(user_id)
+
+    def query(self, purchased: bool, added: bool, product_name: str, distinct_users: bool = False) -> Dict[str, Tuple[int, int]]:
+        """
+        Returns a dictionary with the estimates (and error bounds) for each product
+        matching the `purchased` and `added` flags. The estimate is the number of
+        operations or, if `distinct_users` is set, the number of distinct users.
+        """
+        dictionary: Dict[str, Tuple[int, int]] = {}
+        for key, users in self._users.items():
+            if key[0] != added or key[1] != purchased:
+                continue
+            if product_name and key[2] != product_name:
+                continue
+            if distinct_users:
+                dictionary[key[2]] = (users.estimate(), users.error())
+            else:
+                dictionary[key[2]] = (self._counts.estimate(self._key(*key)), self._counts.error())
+        return dictionary
+
+    def copy(self) -> "SketchIndex":
+        """
+        Returns a copy of this index (sketches included).
+        """
+        sketch_index = SketchIndex()
+        sketch_index._counts = self._counts.copy()
+        sketch_index._users = {key: users.copy() for key, users in self._users.items()}
+        return sketch_index
+
+    def merge(self, other: "SketchIndex") -> None:
+        """
+        Merges the sketches of another index (for example from another shard) into this one.
+        """
+        self._counts.merge(other._counts)
+        for key, users in other._users.items():
+            if key not in self._users:
+                self._users[key] = HyperLogLog()
+            self._users[key].merge(users)
+
+    def _key(self, added: bool, purchased: bool, product_name: str) -> str:
+        """
+        Returns the key used in the count-min sketch.
+        """
+        return str(added) + "|" + str(purchased) + "|" + product_name
@@ -23,7 +23,7 @@ SOFTWARE.
 """
 
 # Generic libraries
-from typing import Dict, Tuple, List, Any
+from typing import Dict, Tuple, List, Union, Any
 import json
 
 # Local libraries
@@ -97,12 +97,13 @@ class UserData:
     _first_name: str = None
     _last_name: str = None
     _history: HistoryContainer = None
-    def __init__(self, parent, id: str, first_name: str, last_name: str, history: Dict[str, Tuple[str, str, bool, bool, str]]) -> None:
+    _history_cache = None
+    def __init__(self, parent, id: str, first_name: str, last_name: str, history: Union[Dict[str, Tuple[str, str, bool, bool, str]], HistoryContainer]) -> None:
         self._data_manager = parent
         self._id = id
         self._first_name = first_name
         self._last_name = last_name
-        self._history = HistoryContainer(history)
+        self._history = history if isinstance(history, HistoryContainer) else HistoryContainer(history)
 
     def id(self) -> str:
         """
@@ -136,13 +137,21 @@ class UserData:
         local_dictionary: Dict[str, Any] = {}
         local_dictionary[FIRST_NAME] = self._first_name
         local_dictionary[LAST_NAME] = self._last_name
-        local_dictionary[HISTORY] = self._history.dictionary()
+        local_dictionary[HISTORY] = self.history().dictionary()
         return local_dictionary
 
     def history(self) -> HistoryContainer:
         """
         Return the HistoryContainer for this UserData.
+
+        Note
+        ----
+
+        If the `DataManager` has a memory budget the history might have been
+        evicted to disk, in which case it is reloaded here.
         """
+        if self._history_cache is not None:
+            return self._history_cache.access(self)
         return self._history
 
     def query(self, purchased: bool, added: bool, above:int, below:int, product_name: str) -> Dict[str, int]:
@@ -150,7 +159,14 @@ class UserData:
         Returns a dictionary with the query made for the `purchase` and
         `added` flags for this user.
         """
-        return self._history.query(purchased=purchased, added=added, above=above, below=below, product_name=product_name)
+        return self.history().query(purchased=purchased, added=added, above=above, below=below, product_name=product_name)
+
+    def withHistory(self, history: HistoryContainer) -> "UserData":
+        """
+        Returns a copy of this UserData with another HistoryContainer (this
+        one is left untouched).
+        """
+        return UserData(self._data_manager, self._id, self._first_name, self._last_name, history)
 
     def user(self) -> User:
         return User(self._data_manager, self.id(), self.firstName(), self.lastName())
@@ -160,7 +176,7 @@ class UserData:
         """
         Iterating over this object returns the operations.
         """
-        for value in self._history:
+        for value in self.history():
             yield value
 
 
@@ -0,0 +1,265 @@
+"""
+MIT License
+
+Copyright (c) 2022 Pedro Correia
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+
+
+# Generic libraries
+from typing import Dict, List, Iterable, Callable, Any
+import urllib.request
+import threading
+import random
+import math
+import time
+import json
+
+# Local libraries
+from .CommonVariables import *
+from .DataManager import DataManager
+
+
+TYPE: str = "type"
+# NOTE: same flags as shobo.py (in the same order) and an optional label
+#       for the report (see `queryType`).
+RECORD_KEYS: List[str] = [USERID, USERNAME, PRODUCTNAME, PURCHASED, ADDED, REMOVED, ABOVE, BELOW, EXPLAIN, TYPE]
+FILTER_KEYS: List[str] = [PURCHASED, ADDED, REMOVED, ABOVE, BELOW]
+
+
+def readWorkload(path: str) -> List[Dict[str, Any]]:
+    """
+    Reads query records from a JSONL file (one json object per line with the
+    flags of shobo.py as keys, e.g. `{"removed": true, "above": 300}`, and an
+    optional `type`). Empty lines are skipped.
+    """
+    records: List[Dict[str, Any]] = []
+    with open(path, "r") as fid:
+        for number, line in enumerate(fid):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            unknown = set(record) - set(RECORD_KEYS)
+            if unknown:
+                raise ValueError("Unknown keys in line " + str(number + 1) + " of " + path + ": " + ", ".join(sorted(unknown)))
+            records.append(record)
+    return records
+
+
+def recordQuery(path: str, record: Dict[str, Any]) -> None:
+    """
+    Appends a query record to a JSONL file (only the flags that are set).
+    """
+    record = {key: record[key] for key in RECORD_KEYS if record.get(key) not in (None, False)}
+    with open(path, "a") as fid:
+        fid.write(json.dumps(record) + "\n")
+
+
+def generateWorkload(data_manager: DataManager, number: int, seed: int = None) -> List[Dict[str, Any]]:
+    """
+    Returns `number` random query records over the users and products of the
+    data manager, mixing the query types of shobo.py.
+    """
+    generator = random.Random(seed)
+    user_ids = data_manager.userIds()
+    products = sorted(data_manager.query(added=True)) + sorted(data_manager.query(added=False))
+    records: List[Dict[str, Any]] = []
+    for _ in range(number):
+        record: Dict[str, Any] = {}
+        kind = generator.random()
+        if kind < 0.1:
+            record[USERID] = generator.choice(user_ids)
+        elif kind < 0.15:
+            record[USERNAME] = data_manager.userById(generator.choice(user_ids)).name()
+        else:
+            if kind < 0.35:
+                record[USERID] = generator.choice(user_ids)
+            record[generator.choice([PURCHASED, ADDED, REMOVED])] = True
+            if generator.random() < 0.3 and products:
+                record[PRODUCTNAME] = generator.choice(products)
+            if generator.random() < 0.4:
+                record[ABOVE] = generator.randrange(0, 600, 50)
+            if generator.random() < 0.4:
+                record[BELOW] = record.get(ABOVE, 0) + generator.randrange(100, 600, 50)
+        records.append(record)
+    return records
+
+
+def queryType(record: Dict[str, Any]) -> str:
+    """
+    Returns the type of a query record, used to break the report down: the
+    record `type` if it has one, `history` (user id alone), `ids` (user name
+    alone) or `query` followed by the flags, `price` if limited by price and
+    `product` if limited by product (e.g. `query:removed+price`, `user_query:purchased`).
+    """
+    if record.get(TYPE):
+        return str(record[TYPE])
+    if not any(record.get(key) for key in FILTER_KEYS):
+        if record.get(USERID):
+            return "history"
+        if record.get(USERNAME):
+            return "ids"
+    parts = [key for key in (PURCHASED, ADDED, REMOVED) if record.get(key)]
+    if record.get(ABOVE) or record.get(BELOW):
+        parts.append("price")
+    if record.get(PRODUCTNAME):
+        parts.append("product")
+    prefix = "user_query" if record.get(USERID) or record.get(USERNAME) else "query"
+    return prefix + ":" + "+".join(parts)
+
+
+def runQuery(data_manager: DataManager, record: Dict[str, Any]) -> Any:
+    """
+    Runs a query record against the data manager, the same way shobo.py does
+    with the equivalent command line flags.
+    """
+    added = bool(record.get(ADDED)) and not record.get(REMOVED)
+    filtered = any(record.get(key) for key in FILTER_KEYS)
+    user_id = record.get(USERID)
+    if record.get(USERNAME) and not user_id:
+        users = data_manager.userByName(record[USERNAME])
+        if not filtered or not users:
+            return [user.id() for user in users]
+        user_id = users[0].id()
+    if user_id and not filtered:
+        user = data_manager.userById(user_id)
+        return user.name(), user.history()
+    return data_manager.query(user_id=user_id,
+                              product_name=record.get(PRODUCTNAME) or None,
+                              purchased=bool(record.get(PURCHASED)),
+                              added=added,
+                              above=record.get(ABOVE) or None,
+                              below=record.get(BELOW) or None,
+                              explain=bool(record.get(EXPLAIN)))
+
+
+def httpTarget(url: str, timeout: float = 30) -> Callable[[Dict[str, Any]], Any]:
+    """
+    Returns a target posting each query record as json to a server endpoint
+    (any response other than 2xx raises an error).
+    """
+    def target(record: Dict[str, Any]) -> Any:
+        request = urllib.request.Request(url, data=json.dumps(record).encode("utf-8"), headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.read()
+    return target
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    Returns the percentile (nearest rank) of already sorted values.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values), max(1, math.ceil(fraction * len(values)))) - 1]
+
+
+class WorkloadReplay:
+    """
+    The `WorkloadReplay` runs a list of query records against a target (by default
+    the `DataManager`, in process) from `concurrency` threads, optionally at a fixed
+    `rate` (queries per second), and reports latency percentiles and throughput,
+    overall and per query type (see `queryType`).
+
+    Note
+    ----
+
+    With a `rate` every query has a scheduled start time and its latency is
+    measured from it, so queries waiting for a busy worker count the wait as well
+    (a slow target then shows up in the percentiles instead of only lowering the
+    rate actually achieved). Without a `rate` queries run back to back and the
+    latency is the time of the call alone.
+    """
+    _target: Callable[[Dict[str, Any]], Any] = None
+    _concurrency: int = None
+    _rate: float = None
+    def __init__(self, target: Callable[[Dict[str, Any]], Any], concurrency: int = 1, rate: float = None) -> None:
+        if concurrency < 1:
+            raise ValueError("The concurrency must be at least 1.")
+        self._target = target
+        self._concurrency = concurrency
+        self._rate = rate
+
+    def run(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Runs all records and returns the report: number of `requests` and `errors`,
+        `duration` (seconds), `throughput` (requests per second), latency `p50`,
+        `p95`, `p99`, `mean` and `max` (milliseconds) and the same per query type
+        under `types`.
+        """
+        records = list(records)
+        latencies: List[float] = [0.0 for _ in records]
+        errors: List[bool] = [False for _ in records]
+        next_record = iter(range(len(records)))
+        lock = threading.Lock()
+        start = time.perf_counter()
+        def worker() -> None:
+            while True:
+                with lock:
+                    number = next(next_record, None)
+                if number is None:
+                    return
+                scheduled = None
+                if self._rate:
+                    scheduled = start + number / self._rate
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                began = time.perf_counter()
+                try:
+                    self._target(records[number])
+                except Exception:
+                    errors[number] = True
+                latencies[number] = time.perf_counter() - (scheduled if scheduled is not None else began)
+        threads = [threading.Thread(target=worker) for _ in range(self._concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+        report = self._statistics(latencies, errors, duration)
+        types: Dict[str, List[int]] = {}
+        for number, record in enumerate(records):
+            types.setdefault(queryType(record), []).append(number)
+        report["types"] = {}
+        for name, numbers in sorted(types.items()):
+            statistics = self._statistics([latencies[number] for number in numbers], [errors[number] for number in numbers], duration)
+            del statistics["duration"]
+            del statistics["throughput"]
+            report["types"][name] = statistics
+        return report
+
+    def _statistics(self, latencies: List[float], errors: List[bool], duration: float) -> Dict[str, Any]:
+        """
+        Returns the counts, throughput and latency statistics (in milliseconds).
+        """
+        ordered = sorted(latency * 1000 for latency in latencies)
+        return {
+            "requests": len(ordered),
+            "errors": sum(errors),
+            "duration": duration,
+            "throughput": len(ordered) / duration if duration > 0 else 0.0,
+            "p50": percentile(ordered, 0.50),
+            "p95": percentile(ordered, 0.95),
+            "p99": percentile(ordered, 0.99),
+            "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+            "max": ordered[-1] if ordered else 0.0,
+        }
@@ -1 +1,2 @@
-from .DataManager import DataManager
\ No newline at end of file
+from .DataManager import DataManager
+from .WorkloadReplay import WorkloadReplay, readWorkload, recordQuery, generateWorkload, runQuery, httpTarget
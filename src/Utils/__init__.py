@@ -1 +1,2 @@
-from .singleton import SingletonMetaClass
\ No newline at end of file
+from .singleton import SingletonMetaClass
+from .memory import deepsizeof
\ No newline at end of file